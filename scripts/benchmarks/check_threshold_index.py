@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Randomized equivalence check: ThresholdIndex against the full scan.
+
+Builds a random book of open positions, then runs ticks of position churn
+(opens, closes, edits), token price moves and SOL drift. Every tick the
+positions flagged by `find_breaches_indexed` must equal those flagged by the
+full scalar scan (and the vectorized scan when NumPy is available), with the
+same price, PnL and margin ratio. SOL drift regularly leaves the index's band,
+so both incremental updates and rebuilds are covered. Exits non-zero on the
+first mismatching tick.
+
+Usage:
+  python scripts/benchmarks/check_threshold_index.py
+  python scripts/benchmarks/check_threshold_index.py --positions 50000 --ticks 60 --seed 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import liquidation_watcher as lw  # noqa: E402
+
+
+def random_row(rng: random.Random, position_id: int, tokens: list[str], prices: dict) -> dict:
+    token = rng.choice(tokens)
+    entry = prices[token] * rng.uniform(0.9, 1.1)
+    is_long = rng.random() < 0.6
+    distance = rng.uniform(0.005, 0.3)
+    row = {
+        "id": position_id,
+        "wallet_address": f"W{position_id % 97}",
+        "token_address": token,
+        "token_symbol": token[:6],
+        "direction": rng.choice(("Long", "long", None)) if is_long else rng.choice(("Short", "short")),
+        "entry_price": entry,
+        "liquidation_price": entry * (1 - distance if is_long else 1 + distance),
+        "amount": rng.uniform(1, 1000),
+        "leverage": rng.choice((1, 2, 5, 10, 50, "3", None)),
+        "collateral_sol": rng.uniform(0.01, 10),
+        "status": "open",
+        "updated_at": "2025-01-01T00:00:00+00:00",
+    }
+    # Rows the index cannot place; they must still be evaluated every tick.
+    if rng.random() < 0.01:
+        row[rng.choice(("amount", "entry_price", "collateral_sol"))] = rng.choice(("nan", 0, -1, None))
+    return row
+
+
+def breach_set(breaches: list) -> set:
+    # NaN never equals itself; compare it as a marker so unusable rows still match.
+    return {
+        (position.id, *("nan" if math.isnan(value) else value for value in values))
+        for position, *values in breaches
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--positions", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=40)
+    parser.add_argument("--churn", type=float, default=0.01, help="share of the book opened, closed or edited per tick")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    lw.logger.setLevel(logging.ERROR)
+    rng = random.Random(args.seed)
+    tokens = [f"Tok{idx:040d}" for idx in range(args.tokens)]
+    prices = {token: rng.uniform(0.001, 10.0) for token in tokens}
+    sol_price = 150.0
+
+    watcher = lw.LiquidationWatcher(price_sources=[])
+    book = watcher.position_book
+    index = watcher.threshold_index
+    rows = {position_id: random_row(rng, position_id, tokens, prices) for position_id in range(args.positions)}
+    book.replace(rows.values())
+    next_id = args.positions
+
+    compared = 0
+    for tick in range(1, args.ticks + 1):
+        changed = []
+        for _ in range(max(1, int(len(rows) * args.churn))):
+            action = rng.random()
+            if action < 0.4 or not rows:
+                row = random_row(rng, next_id, tokens, prices)
+                next_id += 1
+            elif action < 0.7:
+                row = {**rows[rng.choice(list(rows))], "status": "closed"}
+            else:
+                row = dict(rows[rng.choice(list(rows))])
+                row["liquidation_price"] = float(row["entry_price"] or 1.0) * rng.uniform(0.5, 1.5)
+                row["amount"] = rng.uniform(1, 1000)
+            changed.append(row)
+            if row["status"] == "open":
+                rows[row["id"]] = row
+            else:
+                rows.pop(row["id"], None)
+        index.apply(*book.apply(changed))
+
+        for token in tokens:
+            prices[token] *= 1 + rng.uniform(-0.08, 0.08)
+        sol_price *= 1 + rng.uniform(-0.06, 0.06)
+        # Some tokens go unpriced on a tick, as when a fetch fails.
+        price_map = {token: price for token, price in prices.items() if rng.random() > 0.05}
+
+        positions = book.values()
+        expected = breach_set(watcher.find_breaches_scalar(positions, price_map, sol_price))
+        engines = {"indexed": breach_set(watcher.find_breaches_indexed(positions, price_map, sol_price))}
+        if lw.np is not None:
+            engines["vectorized"] = breach_set(
+                watcher.find_breaches_vectorized(positions, price_map, sol_price, book.version)
+            )
+        for engine, found in engines.items():
+            if found != expected:
+                missing = sorted(item[0] for item in expected - found)
+                extra = sorted(item[0] for item in found - expected)
+                print(f"MISMATCH tick={tick} engine={engine}: missing={missing[:10]} extra={extra[:10]}")
+                return 1
+        compared += len(positions)
+        print(
+            f"tick={tick} open={len(positions)} breaches={len(expected)} "
+            f"sol={sol_price:.2f} index_ref={index.sol_ref:.2f}"
+        )
+
+    print(f"OK: {args.ticks} tick(s), {compared} position evaluations, engines agree with the full scan.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
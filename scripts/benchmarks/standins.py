@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the services the scripts talk to.
+
+One aiohttp server plays all of them:
+  - Supabase REST (PostgREST) for trading_positions, deposit_transactions,
+    user_profiles and the RPC functions the scripts call
+  - Supabase Realtime postgres_changes for trading_positions on
+    /realtime/v1/websocket; every insert and update made through the
+    stand-in is pushed to joined channels
+  - Birdeye /public/price and /defi/multi_price, and the Birdeye price
+    websocket on /socket/solana: SUBSCRIBE_PRICE / UNSUBSCRIBE_PRICE messages
+    are honoured and every subscribed token gets a PRICE_DATA message each
+    `stream_interval_ms`
+  - Solana JSON-RPC getSignaturesForAddress / getTransaction on POST /
+
+Latency, jitter and error rate apply to every request. The dataset is
+generated from a seed, and control endpoints let a benchmark reset it and read
+per-route request counts:
+  POST /_reset   JSON body overrides any StandinConfig field
+  GET  /_stats   {"requests": {...}, "errors": {...}}
+
+Run standalone with:
+  python scripts/benchmarks/standins.py --port 8787 --positions 10000 --tokens 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+from aiohttp import WSMsgType, web
+
+
+SOL_TOKEN_ADDRESS = "So11111111111111111111111111111111111111112"
+SYSTEM_PROGRAM = "11111111111111111111111111111111"
+PLATFORM_WALLET = "P1atformWa11et1111111111111111111111111111111"
+
+
+@dataclass
+class StandinConfig:
+    seed: int = 7
+    positions: int = 1000
+    tokens: int = 50
+    deposits: int = 20
+    signatures: int = 200
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    price_volatility: float = 0.02
+    stream_interval_ms: float = 100.0
+
+
+def ts(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def coerce(raw: str, sample: object) -> object:
+    if isinstance(sample, bool):
+        return raw == "true"
+    if isinstance(sample, (int, float)):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def split_top_level(text: str) -> list[str]:
+    parts, depth, current = [], 0, ""
+    for char in text:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def plain_condition(column: str, op_value: str) -> Callable[[dict], bool]:
+    op, value = op_value.split(".", 1)
+    if op == "in":
+        options = [option for option in value.strip("()").split(",") if option]
+        return lambda row: any(
+            row.get(column) == coerce(option, row.get(column)) for option in options
+        )
+    if op == "is":
+        expected = {"null": None, "true": True, "false": False}[value]
+        return lambda row: row.get(column) is expected
+
+    def compare(row: dict) -> bool:
+        actual = row.get(column)
+        if actual is None:
+            return False
+        target = coerce(value, actual)
+        return {
+            "eq": actual == target,
+            "neq": actual != target,
+            "gt": actual > target,
+            "gte": actual >= target,
+            "lt": actual < target,
+            "lte": actual <= target,
+        }[op]
+
+    return compare
+
+
+def logic_condition(kind: str, inner: str) -> Callable[[dict], bool]:
+    checks = [item_condition(part) for part in split_top_level(inner)]
+    combine = any if kind == "or" else all
+    return lambda row: combine(check(row) for check in checks)
+
+
+def item_condition(expr: str) -> Callable[[dict], bool]:
+    """Compile `col.op.value`, `or(...)` or `and(...)` from inside a logic list."""
+    for kind in ("or", "and"):
+        if expr.startswith(f"{kind}("):
+            return logic_condition(kind, expr[len(kind) + 1:-1])
+    column, op_value = expr.split(".", 1)
+    return plain_condition(column, op_value)
+
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def filter_rows(rows: list[dict], query) -> list[dict]:
+    checks = [
+        logic_condition(key, value[1:-1]) if key in ("or", "and") else plain_condition(key, value)
+        for key, value in query.items()
+        if key not in RESERVED_PARAMS
+    ]
+    selected = [row for row in rows if all(check(row) for check in checks)]
+
+    order = query.get("order")
+    if order:
+        for term in reversed(order.split(",")):
+            column, _, direction = term.partition(".")
+            selected.sort(
+                key=lambda row: (row.get(column) is None, row.get(column)),
+                reverse=direction.startswith("desc"),
+            )
+    offset = int(query.get("offset", 0))
+    limit = query.get("limit")
+    return selected[offset:offset + int(limit)] if limit else selected[offset:]
+
+
+class Standins:
+    def __init__(self, config: StandinConfig) -> None:
+        self.channels: Dict[web.WebSocketResponse, set[str]] = {}
+        self.reset(config)
+
+    def reset(self, config: StandinConfig) -> None:
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.build_market()
+        self.build_deposits()
+
+    def build_market(self) -> None:
+        rng = self.rng
+        now = datetime.now(timezone.utc)
+        self.token_addresses = [f"Tok{idx:040d}" for idx in range(self.config.tokens)]
+        self.prices = {address: rng.uniform(0.001, 10.0) for address in self.token_addresses}
+        self.prices[SOL_TOKEN_ADDRESS] = 150.0
+
+        self.trading_positions: list[dict] = []
+        for idx in range(1, self.config.positions + 1):
+            token = rng.choice(self.token_addresses)
+            entry = self.prices[token]
+            is_long = rng.random() < 0.6
+            leverage = rng.choice((2, 5, 10, 20, 50))
+            # Most positions sit far from liquidation; a few are close.
+            distance = rng.uniform(0.005, 0.05) if rng.random() < 0.05 else 0.8 / leverage
+            self.trading_positions.append(
+                {
+                    "id": idx,
+                    "wallet_address": f"W{idx % 997:043d}",
+                    "token_address": token,
+                    "token_symbol": token[:6],
+                    "token_shard": idx % 1024,
+                    "direction": "Long" if is_long else "Short",
+                    "entry_price": entry,
+                    "liquidation_price": entry * (1 - distance if is_long else 1 + distance),
+                    "amount": rng.uniform(1, 1000),
+                    "leverage": leverage,
+                    "collateral_sol": rng.uniform(0.1, 10),
+                    "status": "open",
+                    "updated_at": ts(now - timedelta(seconds=rng.uniform(0, 3600))),
+                }
+            )
+
+    def build_deposits(self) -> None:
+        rng = self.rng
+        now = datetime.now(timezone.utc)
+        self.deposit_transactions: list[dict] = []
+        self.user_profiles: Dict[str, dict] = {}
+        self.transactions: Dict[str, dict] = {}
+        entries = []
+
+        for idx in range(1, self.config.deposits + 1):
+            wallet = f"U{idx:043d}"
+            amount = round(rng.uniform(0.01, 5), 6)
+            created = now - timedelta(minutes=rng.uniform(1, 50))
+            self.deposit_transactions.append(
+                {
+                    "id": idx,
+                    "wallet_address": wallet,
+                    "amount": amount,
+                    "created_at": created.isoformat(),
+                    "txid": None,
+                    "is_verified": False,
+                    "platform_wallet": PLATFORM_WALLET,
+                }
+            )
+            self.user_profiles[wallet] = {"wallet_address": wallet, "sol_balance": 0.0}
+            entries.append(self.add_transfer(wallet, amount, created + timedelta(seconds=30)))
+
+        while len(entries) < self.config.signatures:
+            noise_wallet = f"N{rng.randrange(10**6):043d}"
+            noise_time = now - timedelta(minutes=rng.uniform(0, 120))
+            entries.append(self.add_transfer(noise_wallet, rng.uniform(0.01, 5), noise_time))
+
+        entries.sort(key=lambda entry: entry["blockTime"], reverse=True)
+        self.signatures = entries
+
+    def add_transfer(self, source: str, amount_sol: float, when: datetime) -> dict:
+        signature = f"Sig{len(self.transactions):084d}"
+        block_time = int(when.timestamp())
+        self.transactions[signature] = {
+            "blockTime": block_time,
+            "slot": block_time,
+            "meta": {"err": None},
+            "transaction": {
+                "message": {
+                    "accountKeys": [
+                        {"pubkey": source},
+                        {"pubkey": PLATFORM_WALLET},
+                        {"pubkey": SYSTEM_PROGRAM},
+                    ],
+                    "instructions": [
+                        {
+                            "program": "system",
+                            "parsed": {
+                                "type": "transfer",
+                                "info": {
+                                    "source": source,
+                                    "destination": PLATFORM_WALLET,
+                                    "lamports": int(round(amount_sol * 1_000_000_000)),
+                                },
+                            },
+                        }
+                    ],
+                },
+                "signatures": [signature],
+            },
+        }
+        return {"signature": signature, "blockTime": block_time, "slot": block_time, "err": None}
+
+    def price(self, address: str) -> Optional[float]:
+        base = self.prices.get(address)
+        if base is None:
+            return None
+        vol = self.config.price_volatility
+        return base * (1 + self.rng.uniform(-vol, vol))
+
+    # -- middleware ------------------------------------------------------
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        if request.path.startswith("/_"):
+            return await handler(request)
+
+        route = f"{request.method} {request.path}"
+        self.requests[route] = self.requests.get(route, 0) + 1
+        delay = self.config.latency_ms + self.rng.uniform(0, self.config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self.rng.random() < self.config.error_rate:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            status = 429 if request.path == "/" else 503
+            return web.json_response({"message": "injected failure"}, status=status)
+        return await handler(request)
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware], client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/_reset", self.handle_reset)
+        app.router.add_get("/_stats", self.handle_stats)
+        app.router.add_get("/public/price", self.handle_price)
+        app.router.add_get("/defi/multi_price", self.handle_multi_price)
+        app.router.add_get("/socket/solana", self.handle_price_socket)
+        app.router.add_post("/", self.handle_rpc)
+        app.router.add_get("/rest/v1/{table}", self.handle_select)
+        app.router.add_post("/rest/v1/{table}", self.handle_insert)
+        app.router.add_patch("/rest/v1/{table}", self.handle_update)
+        app.router.add_delete("/rest/v1/{table}", self.handle_delete)
+        app.router.add_post("/rest/v1/rpc/{function}", self.handle_function)
+        app.router.add_get("/realtime/v1/websocket", self.handle_realtime)
+        return app
+
+    # -- control ---------------------------------------------------------
+
+    async def handle_reset(self, request: web.Request) -> web.Response:
+        overrides = await request.json() if request.can_read_body else {}
+        known = {field.name for field in fields(StandinConfig)}
+        config = StandinConfig(**{**asdict(self.config), **{
+            key: value for key, value in overrides.items() if key in known
+        }})
+        self.reset(config)
+        return web.json_response(asdict(config))
+
+    async def handle_stats(self, _: web.Request) -> web.Response:
+        return web.json_response({"requests": self.requests, "errors": self.errors})
+
+    # -- Birdeye ---------------------------------------------------------
+
+    async def handle_price(self, request: web.Request) -> web.Response:
+        value = self.price(request.query.get("address", ""))
+        if value is None:
+            return web.json_response({"success": False, "message": "unknown token"})
+        return web.json_response({"success": True, "data": {"value": value}})
+
+    async def handle_multi_price(self, request: web.Request) -> web.Response:
+        data = {}
+        for address in request.query.get("list_address", "").split(","):
+            value = self.price(address)
+            if value is not None:
+                data[address] = {"value": value, "updateUnixTime": int(time.time())}
+        return web.json_response({"success": True, "data": data})
+
+    async def handle_price_socket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(protocols=("echo-protocol",))
+        await ws.prepare(request)
+        subscribed: set[str] = set()
+        pusher = asyncio.create_task(self.push_prices(ws, subscribed))
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                envelope = json.loads(message.data)
+                address = (envelope.get("data") or {}).get("address")
+                if envelope.get("type") == "SUBSCRIBE_PRICE" and address:
+                    subscribed.add(address)
+                elif envelope.get("type") == "UNSUBSCRIBE_PRICE":
+                    subscribed.discard(address)
+        finally:
+            pusher.cancel()
+        return ws
+
+    async def push_prices(self, ws: web.WebSocketResponse, subscribed: set[str]) -> None:
+        while not ws.closed:
+            await asyncio.sleep(self.config.stream_interval_ms / 1000)
+            now = int(time.time())
+            for address in list(subscribed):
+                value = self.price(address)
+                if value is None or ws.closed:
+                    continue
+                self.requests["WS PRICE_DATA"] = self.requests.get("WS PRICE_DATA", 0) + 1
+                await ws.send_json(
+                    {
+                        "type": "PRICE_DATA",
+                        "data": {"address": address, "c": value, "unixTime": now, "type": "1m"},
+                    }
+                )
+
+    # -- Supabase --------------------------------------------------------
+
+    def table(self, name: str) -> list[dict]:
+        if name == "user_profiles":
+            return list(self.user_profiles.values())
+        rows = getattr(self, name, None)
+        if not isinstance(rows, list):
+            raise web.HTTPNotFound(text=f'{{"message": "unknown table {name}"}}')
+        return rows
+
+    def respond(self, request: web.Request, rows: list[dict]) -> web.Response:
+        if "vnd.pgrst.object" in request.headers.get("Accept", ""):
+            if len(rows) != 1:
+                return web.json_response({"message": "JSON object requested, multiple (or no) rows returned"}, status=406)
+            return web.json_response(rows[0])
+        return web.json_response(rows)
+
+    async def handle_select(self, request: web.Request) -> web.Response:
+        return self.respond(request, filter_rows(self.table(request.match_info["table"]), request.query))
+
+    async def handle_insert(self, request: web.Request) -> web.Response:
+        name = request.match_info["table"]
+        payload = await request.json()
+        table = self.table(name)
+        now = ts(datetime.now(timezone.utc))
+        inserted = []
+        for item in payload if isinstance(payload, list) else [payload]:
+            row = {"id": max((row["id"] for row in table), default=0) + 1, **item}
+            if name == "trading_positions":
+                row.setdefault("status", "open")
+                row.setdefault("token_shard", row["id"] % 1024)
+                row["updated_at"] = now
+            table.append(row)
+            inserted.append(row)
+            await self.publish(name, "INSERT", row)
+        if "return=representation" not in request.headers.get("Prefer", ""):
+            return web.Response(status=201)
+        return self.respond(request, inserted)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        name = request.match_info["table"]
+        payload = await request.json()
+        rows = filter_rows(self.table(name), request.query)
+        now = ts(datetime.now(timezone.utc))
+        for row in rows:
+            row.update(payload)
+            if "updated_at" in row:
+                row["updated_at"] = now
+            await self.publish(name, "UPDATE", row)
+        if "return=representation" not in request.headers.get("Prefer", ""):
+            return web.Response(status=204)
+        return self.respond(request, rows)
+
+    async def handle_delete(self, request: web.Request) -> web.Response:
+        return web.Response(status=204)
+
+    async def handle_function(self, request: web.Request) -> web.Response:
+        name = request.match_info["function"]
+        body = await request.json()
+        if name == "liquidate_positions_bulk":
+            wanted = {item["id"]: item for item in body["p_liquidations"]}
+            done = []
+            now = ts(datetime.now(timezone.utc))
+            for row in self.trading_positions:
+                item = wanted.get(row["id"])
+                if item and row["status"] in ("open", "opening"):
+                    row.update(
+                        status="liquidated",
+                        close_price=item["close_price"],
+                        current_pnl=item["current_pnl"],
+                        updated_at=now,
+                    )
+                    done.append({"position_id": row["id"]})
+                    await self.publish("trading_positions", "UPDATE", row)
+            return web.json_response(done)
+        if name == "verify_deposits_bulk":
+            used = {row["txid"] for row in self.deposit_transactions if row.get("txid")}
+            by_id = {row["id"]: row for row in self.deposit_transactions}
+            verified = []
+            for item in body["p_matches"]:
+                row = by_id.get(item["id"])
+                if row is None or (row.get("is_verified") and row.get("txid")) or item["txid"] in used:
+                    continue
+                row.update(txid=item["txid"], is_verified=True)
+                used.add(item["txid"])
+                verified.append(row)
+            for row in verified:
+                profile = self.user_profiles.get(row["wallet_address"])
+                if profile is not None:
+                    profile["sol_balance"] += row["amount"]
+            return web.json_response(
+                [
+                    {
+                        "deposit_id": row["id"],
+                        "deposit_wallet": row["wallet_address"],
+                        "credited_amount": row["amount"],
+                        "new_balance": (self.user_profiles.get(row["wallet_address"]) or {}).get("sol_balance"),
+                    }
+                    for row in verified
+                ]
+            )
+        if name == "liquidation_worker_heartbeat":
+            return web.json_response([{"worker_id": body["p_worker_id"]}])
+        return web.json_response(
+            {"code": "PGRST202", "message": f"Could not find the function public.{name}"},
+            status=404,
+        )
+
+    # -- Supabase Realtime -----------------------------------------------
+
+    async def handle_realtime(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.channels[ws] = set()
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                envelope = json.loads(message.data)
+                reply = {"status": "ok", "response": {}}
+                if envelope.get("event") == "phx_join":
+                    changes = (envelope.get("payload") or {}).get("config", {}).get("postgres_changes") or []
+                    self.channels[ws].update(change.get("table") for change in changes)
+                    reply["response"] = {
+                        "postgres_changes": [{**change, "id": idx} for idx, change in enumerate(changes)]
+                    }
+                await ws.send_json(
+                    {
+                        "topic": envelope.get("topic"),
+                        "event": "phx_reply",
+                        "payload": reply,
+                        "ref": envelope.get("ref"),
+                    }
+                )
+        finally:
+            self.channels.pop(ws, None)
+        return ws
+
+    async def publish(self, table: str, change_type: str, row: dict) -> None:
+        message = {
+            "topic": f"realtime:{table}",
+            "event": "postgres_changes",
+            "payload": {
+                "data": {
+                    "schema": "public",
+                    "table": table,
+                    "type": change_type,
+                    "commit_timestamp": ts(datetime.now(timezone.utc)),
+                    "record": dict(row),
+                    "old_record": {"id": row.get("id")},
+                    "errors": None,
+                },
+                "ids": [0],
+            },
+            "ref": None,
+        }
+        for ws, tables in list(self.channels.items()):
+            if table in tables and not ws.closed:
+                await ws.send_json(message)
+
+    # -- Solana JSON-RPC -------------------------------------------------
+
+    async def handle_rpc(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if isinstance(body, list):
+            return web.json_response([self.rpc_call(call) for call in body])
+        return web.json_response(self.rpc_call(body))
+
+    def rpc_call(self, call: dict) -> dict:
+        method, params = call.get("method"), call.get("params") or []
+        if method == "getSignaturesForAddress":
+            options = params[1] if len(params) > 1 else {}
+            entries = self.signatures if params[0] == PLATFORM_WALLET else []
+            signatures = [entry["signature"] for entry in entries]
+            start = signatures.index(options["before"]) + 1 if options.get("before") in signatures else 0
+            end = signatures.index(options["until"]) if options.get("until") in signatures else len(entries)
+            result = entries[start:end][: int(options.get("limit", 1000))]
+        elif method == "getTransaction":
+            result = self.transactions.get(params[0])
+        else:
+            return {"jsonrpc": "2.0", "id": call.get("id"), "error": {"code": -32601, "message": "Method not found"}}
+        return {"jsonrpc": "2.0", "id": call.get("id"), "result": result}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve local Supabase/Birdeye/Solana stand-ins.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    for field in fields(StandinConfig):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    args = parser.parse_args()
+
+    config = StandinConfig(**{field.name: getattr(args, field.name) for field in fields(StandinConfig)})
+    web.run_app(Standins(config).app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
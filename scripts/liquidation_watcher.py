@@ -2,9 +2,9 @@
 """
 Continuous liquidation watcher.
 
-Polls every LIQUIDATION_POLL_SECONDS (default 3s), fetches all open positions from
-Supabase, looks up live prices from Birdeye, and marks underwater positions as
-liquidated inside the `trading_positions` table.
+Polls every LIQUIDATION_POLL_SECONDS (default 3s), keeps an in-memory book of open
+positions synced incrementally from Supabase, looks up live prices from Birdeye,
+and marks underwater positions as liquidated inside the `trading_positions` table.
 
 Environment variables required:
   SUPABASE_URL                  e.g. https://xyzcompany.supabase.co
@@ -15,23 +15,114 @@ Optional knobs:
   LIQUIDATION_POLL_SECONDS      poll cadence in seconds (default: 3)
   BIRDEYE_TIMEOUT_SECONDS       HTTP timeout for Birdeye calls (default: 8)
   BIRDEYE_CONCURRENCY           parallel Birdeye requests (default: 6)
+  BIRDEYE_BATCH_MODE            resolve prices via multi_price batches (default: on)
+  BIRDEYE_BATCH_SIZE            addresses per multi_price request (default: 100)
+  PRICE_SOURCES                 REST price providers queried concurrently, from
+                                birdeye, jupiter, dexscreener (default: birdeye).
+                                Adding sources with PRICE_AGGREGATION=first lets
+                                whichever answers first drive liquidations with
+                                no cross-check; pair extra sources with median
+  PRICE_AGGREGATION             "first": first valid quote per token wins;
+                                "median": median of the quotes that agree within
+                                PRICE_SOURCE_TOLERANCE (default: first)
+  PRICE_SOURCE_TOLERANCE        relative spread allowed around the median (default: 0.02)
+  PRICE_MEDIAN_WAIT_SECONDS     in median mode, how long after a token's first quote
+                                to wait for the other sources (default: 0.5)
+  PRICE_SOURCE_FAILURES         consecutive failed calls that open a source's circuit
+                                breaker (default: 3)
+  PRICE_SOURCE_COOLDOWN_SECONDS how long an open breaker skips its source before a
+                                trial call (default: 30)
+  PRICE_CACHE_TTL_SECONDS       age at which a cached price is refreshed (default: 4)
+  PRICE_MAX_STALENESS_SECONDS   oldest price a liquidation may use (default: 15)
+  TICK_PRICE_DEADLINE_SECONDS   longest a tick waits for price fetches; slower ones
+                                keep running and feed the next tick (default: 2;
+                                0 waits for every fetch)
+  HEDGE_DELAY_SECONDS           send a duplicate Birdeye request for tokens near a
+                                trigger once the first is this slow (default: 0.75;
+                                0 disables hedging)
+  HEDGE_DISTANCE                relative distance to the nearest trigger below which
+                                a token's requests are hedged (default: 0.02)
+  POSITION_RESYNC_SECONDS       full position rescan cadence (default: 300)
+  POSITION_CURSOR_LOOKBACK_SECONDS
+                                overlap re-read on each incremental sync (default: 5)
+  POSITION_PAGE_SIZE            rows per trading_positions page (default: 1000)
+  POSITION_FEED                 also apply trading_positions changes pushed by
+                                Supabase Realtime as they commit (default: off;
+                                REST syncing keeps running as reconciliation)
+  SUPABASE_REALTIME_URL         realtime websocket (default: derived from SUPABASE_URL)
+  VECTORIZED_EVALUATION         evaluate positions with NumPy columns (default: on)
+  THRESHOLD_INDEX               only evaluate positions whose trigger was crossed,
+                                found by bisecting a per-token index (default: on)
+  THRESHOLD_INDEX_SOL_BAND      relative SOL move that forces an index rebuild
+                                (default: 0.01)
+  LIQUIDATION_BULK_RPC          write liquidations via liquidate_positions_bulk
+                                (default: on; falls back to guarded PATCHes)
+  LIQUIDATION_BATCH_SIZE        positions per bulk liquidation call (default: 50)
+  LIQUIDATION_WRITE_CONCURRENCY parallel liquidation writes (default: 8)
+  HTTP_POOL_SIZE                keep-alive connections shared by all hosts (default: 100)
+  HTTP_POOL_PER_HOST            keep-alive connections per host (default: 32)
+  HTTP_KEEPALIVE_SECONDS        idle time before a pooled connection closes (default: 30)
+  HTTP_DNS_CACHE_SECONDS        DNS cache TTL (default: 300; 0 disables)
+  HTTP_COMPRESSION              ask for gzip/deflate responses (default: on)
+  STREAMING_PRICES              also consume Birdeye's websocket price feed and
+                                re-evaluate a token as soon as it moves (default: off;
+                                polling keeps running as reconciliation)
+  BIRDEYE_WS_URL                websocket feed URL (default: Birdeye public socket)
+  ADAPTIVE_POLLING              refresh each token on its own interval, shorter the
+                                closer its nearest position is to a trigger and the
+                                more volatile it is (default: off)
+  ADAPTIVE_MIN_INTERVAL_SECONDS fastest per-token refresh (default: 1)
+  ADAPTIVE_MAX_INTERVAL_SECONDS slowest per-token refresh; capped at
+                                PRICE_MAX_STALENESS_SECONDS (default: 15)
+  ADAPTIVE_REQUEST_BUDGET       Birdeye requests per second across all tokens
+                                (default: 10; 0 disables the limit)
+  ADAPTIVE_SAFETY_FACTOR        fraction of the expected time-to-trigger used as
+                                the interval (default: 0.25)
+  SHARDING                      split token_address space across several watcher
+                                processes via consistent hashing (default: off)
+  SHARD_WORKER_ID               this worker's lease id (default: <hostname>-<pid>)
+  SHARD_LEASE_SECONDS           heartbeat age after which a worker's shard is
+                                reassigned (default: 20)
+  SHARD_HEARTBEAT_SECONDS       lease renewal cadence (default: 5)
+  METRICS_HOST / METRICS_PORT   Prometheus-style /metrics endpoint
+                                (default: 127.0.0.1:9108; port 0 disables)
+  METRICS_LOG_SECONDS           periodic metrics summary in the log (default: 60;
+                                0 disables)
+  RECORD_PATH                   append every tick's positions and prices to this
+                                gzip file for scripts/replay_ticks.py (default: off)
   LOG_LEVEL                     DEBUG | INFO | WARNING | ERROR (default: INFO)
   ENV_FILE                      path to .env to load before reading env vars
 """
 
 from __future__ import annotations
 
+import abc
 import asyncio
+import bisect
+import hashlib
 import json
 import logging
+import math
+import os
 import signal
+import socket
+import statistics
 import sys
 import time
-from datetime import datetime, timezone
-from typing import Dict, Iterable, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple, TypeVar
 
 import aiohttp
-from aiohttp import ClientSession, ClientTimeout
+from aiohttp import ClientSession
+
+from metrics import MetricsRegistry, serve_metrics
+from tick_recorder import TickRecorder
+from transport import TransportStats, create_session, loads, read_json
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - falls back to the scalar evaluator
+    np = None
 
 
 DEFAULT_SUPABASE_URL = "https://lgnlryhkagolllmslioy.supabase.co"
@@ -50,179 +141,2548 @@ DEFAULT_SUPABASE_SERVICE_ROLE_KEY = (
 DEFAULT_BIRDEYE_API_KEY = "a90c0e35649642c6b724ecc181a866ee"
 
 
-SUPABASE_URL = DEFAULT_SUPABASE_URL.rstrip("/")
-SUPABASE_SERVICE_ROLE_KEY = DEFAULT_SUPABASE_SERVICE_ROLE_KEY
-SUPABASE_ANON_KEY = DEFAULT_SUPABASE_ANON_KEY
-BIRDEYE_API_KEY = DEFAULT_BIRDEYE_API_KEY
+SUPABASE_URL = DEFAULT_SUPABASE_URL.rstrip("/")
+SUPABASE_SERVICE_ROLE_KEY = DEFAULT_SUPABASE_SERVICE_ROLE_KEY
+SUPABASE_ANON_KEY = DEFAULT_SUPABASE_ANON_KEY
+BIRDEYE_API_KEY = DEFAULT_BIRDEYE_API_KEY
+
+POLL_SECONDS = 3.0
+BIRDEYE_TIMEOUT_SECONDS = 8.0
+BIRDEYE_CONCURRENCY = 6
+BIRDEYE_BATCH_MODE = True
+BIRDEYE_BATCH_SIZE = 100
+PRICE_SOURCES = ("birdeye",)
+PRICE_AGGREGATION = "first"
+PRICE_SOURCE_TOLERANCE = 0.02
+PRICE_MEDIAN_WAIT_SECONDS = 0.5
+PRICE_SOURCE_FAILURES = 3
+PRICE_SOURCE_COOLDOWN_SECONDS = 30.0
+PRICE_SOURCE_CONCURRENCY = 4
+PRICE_CACHE_TTL_SECONDS = 4.0
+PRICE_MAX_STALENESS_SECONDS = 15.0
+TICK_PRICE_DEADLINE_SECONDS = 2.0
+HEDGE_DELAY_SECONDS = 0.75
+HEDGE_DISTANCE = 0.02
+POSITION_RESYNC_SECONDS = 300.0
+POSITION_CURSOR_LOOKBACK_SECONDS = 5.0
+POSITION_PAGE_SIZE = 1000
+POSITION_FEED = False
+VECTORIZED_EVALUATION = True
+THRESHOLD_INDEX = True
+THRESHOLD_INDEX_SOL_BAND = 0.01
+LIQUIDATION_BULK_RPC = True
+LIQUIDATION_BATCH_SIZE = 50
+LIQUIDATION_WRITE_CONCURRENCY = 8
+HTTP_POOL_SIZE = 100
+HTTP_POOL_PER_HOST = 32
+HTTP_KEEPALIVE_SECONDS = 30.0
+HTTP_DNS_CACHE_SECONDS = 300
+HTTP_COMPRESSION = True
+STREAMING_PRICES = False
+STREAM_RECONNECT_MAX_SECONDS = 30.0
+ADAPTIVE_POLLING = False
+ADAPTIVE_MIN_INTERVAL_SECONDS = 1.0
+ADAPTIVE_MAX_INTERVAL_SECONDS = 15.0
+ADAPTIVE_REQUEST_BUDGET = 10.0
+ADAPTIVE_SAFETY_FACTOR = 0.25
+ADAPTIVE_DEFAULT_VOLATILITY = 0.002  # per sqrt(second), used until a token has history
+ADAPTIVE_VOLATILITY_ALPHA = 0.2
+SHARDING = False
+SHARD_WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+SHARD_LEASE_SECONDS = 20
+SHARD_HEARTBEAT_SECONDS = 5.0
+SHARD_BUCKETS = 1024  # must match trading_positions.token_shard
+SHARD_VNODES = 64
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS_LOG_SECONDS = 60.0
+RECORD_PATH = ""
+LOG_LEVEL = "INFO"
+
+SUPABASE_REST_URL = f"{SUPABASE_URL}/rest/v1"
+SUPABASE_REALTIME_URL = (
+    SUPABASE_URL.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+    + "/realtime/v1/websocket"
+)
+SUPABASE_HEADERS = {
+    "apikey": SUPABASE_SERVICE_ROLE_KEY,
+    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+    "Content-Type": "application/json",
+}
+
+BIRDEYE_PRICE_ENDPOINT = "https://public-api.birdeye.so/public/price"
+BIRDEYE_MULTI_PRICE_ENDPOINT = "https://public-api.birdeye.so/defi/multi_price"
+BIRDEYE_WS_URL = "wss://public-api.birdeye.so/socket/solana"
+JUPITER_PRICE_ENDPOINT = "https://lite-api.jup.ag/price/v3"
+DEXSCREENER_TOKENS_ENDPOINT = "https://api.dexscreener.com/tokens/v1/solana"
+BIRDEYE_HEADERS = {
+    "X-API-KEY": BIRDEYE_API_KEY,
+    "accept": "application/json",
+}
+SOL_TOKEN_ADDRESS = "So11111111111111111111111111111111111111112"
+MARGIN_LIQUIDATION_RATIO = 0.999
+
+OPEN_POSITION_STATUSES = ("open", "opening")
+WRITE_LIQUIDATED = "liquidated"
+WRITE_ALREADY_CLOSED = "already_closed"
+WRITE_FAILED = "failed"
+POSITION_COLUMNS = (
+    "id",
+    "wallet_address",
+    "token_address",
+    "token_symbol",
+    "direction",
+    "entry_price",
+    "liquidation_price",
+    "amount",
+    "leverage",
+    "collateral_sol",
+    "status",
+    "updated_at",
+)
+
+
+logging.basicConfig(
+    level=LOG_LEVEL,
+    stream=sys.stdout,
+    format="%(asctime)s | %(levelname)s | %(message)s",
+)
+logger = logging.getLogger("liquidation-watcher")
+
+T = TypeVar("T")
+
+
+def chunked(iterable: Iterable[T], size: int) -> Iterable[Tuple[T, ...]]:
+    """Yield successive n-sized chunks from iterable."""
+    chunk: list[T] = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield tuple(chunk)
+            chunk = []
+    if chunk:
+        yield tuple(chunk)
+
+
+def iso_utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def format_timestamp(value: datetime) -> str:
+    # PostgREST filter values travel in the query string; avoid a literal "+".
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def to_float(value: Optional[object], default: float = 0.0) -> float:
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class PriceCache:
+    """Last known good price per token, kept across ticks.
+
+    Entries younger than `ttl` are fresh. Entries between `ttl` and `max_stale`
+    are still usable for liquidation decisions but should be refreshed; anything
+    older is treated as a miss.
+    """
+
+    def __init__(self, ttl: float, max_stale: float) -> None:
+        self.ttl = ttl
+        self.max_stale = max(ttl, max_stale)
+        self.entries: Dict[str, Tuple[float, float]] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.max_served_age = 0.0
+
+    def update(self, prices: Dict[str, float], now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        for address, price in prices.items():
+            self.entries[address] = (price, now)
+
+    def lookup(
+        self,
+        addresses: Iterable[str],
+        now: Optional[float] = None,
+    ) -> Tuple[Dict[str, float], list[str], list[str]]:
+        """Split addresses into (usable prices, stale addresses, missing addresses).
+
+        Stale addresses are included in the usable prices as well; the caller
+        decides whether to refresh them in the background.
+        """
+        now = time.monotonic() if now is None else now
+        prices: Dict[str, float] = {}
+        stale: list[str] = []
+        missing: list[str] = []
+
+        for address in addresses:
+            entry = self.entries.get(address)
+            age = now - entry[1] if entry else None
+            if entry is None or age > self.max_stale:
+                self.misses += 1
+                missing.append(address)
+                continue
+
+            prices[address] = entry[0]
+            self.max_served_age = max(self.max_served_age, age)
+            if age > self.ttl:
+                self.stale_hits += 1
+                stale.append(address)
+            else:
+                self.hits += 1
+
+        return prices, stale, missing
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "max_served_age": self.max_served_age,
+        }
+
+    def peek(
+        self,
+        addresses: Iterable[str],
+        now: Optional[float] = None,
+    ) -> Dict[str, float]:
+        """Usable prices (no older than `max_stale`) without touching stats.
+
+        For pushed updates, which are not tick lookups and must not skew
+        `stats()`.
+        """
+        now = time.monotonic() if now is None else now
+        prices: Dict[str, float] = {}
+        for address in addresses:
+            entry = self.entries.get(address)
+            if entry is not None and now - entry[1] <= self.max_stale:
+                prices[address] = entry[0]
+        return prices
+
+    def last_known(self, addresses: Iterable[str]) -> Dict[str, float]:
+        """Most recent price per address regardless of age (no stats)."""
+        return {
+            address: self.entries[address][0]
+            for address in addresses
+            if address in self.entries
+        }
+
+
+class PollScheduler:
+    """Per-token price refresh intervals driven by liquidation risk.
+
+    A token's interval is ADAPTIVE_SAFETY_FACTOR times the time its price would
+    typically take to cover the distance to its nearest trigger, (distance /
+    volatility) ** 2, clamped to [min_interval, max_interval]. Volatility is an
+    EWMA of squared log returns per second. Tokens with no known distance poll at
+    min_interval; SOL, which moves every margin trigger, polls as often as the
+    most urgent token.
+
+    Requests are drawn from a token bucket refilled at `budget` per second (0
+    disables the limit). When more tokens are due than the bucket allows, the
+    most overdue go first and the rest wait for a later tick.
+    """
+
+    def __init__(
+        self,
+        min_interval: float,
+        max_interval: float,
+        budget: float,
+        safety: float = ADAPTIVE_SAFETY_FACTOR,
+        default_volatility: float = ADAPTIVE_DEFAULT_VOLATILITY,
+        alpha: float = ADAPTIVE_VOLATILITY_ALPHA,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.budget = budget
+        self.safety = safety
+        self.default_volatility = default_volatility
+        self.alpha = alpha
+        self.capacity = max(1.0, budget)
+        self.allowance = self.capacity
+        self.refilled_at: Optional[float] = None
+        self.last_polled: Dict[str, float] = {}
+        self.last_prices: Dict[str, Tuple[float, float]] = {}
+        self.variances: Dict[str, float] = {}
+        self.intervals: Dict[str, float] = {}
+        self.due = 0
+        self.deferred = 0
+        self.requests = 0
+
+    def observe(self, prices: Dict[str, float], now: Optional[float] = None) -> None:
+        """Record fresh prices: update volatility and restart each token's interval."""
+        now = time.monotonic() if now is None else now
+        for address, price in prices.items():
+            previous = self.last_prices.get(address)
+            self.last_prices[address] = (price, now)
+            self.last_polled[address] = now
+            if previous is None or previous[0] <= 0 or price <= 0:
+                continue
+            elapsed = now - previous[1]
+            if elapsed <= 0:
+                continue
+            rate = math.log(price / previous[0]) ** 2 / elapsed
+            variance = self.variances.get(address)
+            self.variances[address] = (
+                rate if variance is None else variance + self.alpha * (rate - variance)
+            )
+
+    def volatility(self, address: str) -> float:
+        variance = self.variances.get(address)
+        return self.default_volatility if variance is None else math.sqrt(variance)
+
+    def interval(self, address: str, distance: Optional[float]) -> float:
+        if distance is None or not distance > 0:
+            return self.min_interval
+        volatility = self.volatility(address)
+        if volatility <= 0:
+            return self.max_interval
+        interval = self.safety * (distance / volatility) ** 2
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def plan(
+        self,
+        addresses: Iterable[str],
+        distances: Dict[str, float],
+        batch_size: int = 1,
+        now: Optional[float] = None,
+    ) -> list[str]:
+        """Return the addresses to fetch now, most urgent first, within budget.
+
+        `batch_size` is how many addresses one request covers.
+        """
+        now = time.monotonic() if now is None else now
+        addresses = set(addresses)
+        for tracked in (self.last_polled, self.last_prices, self.variances):
+            for address in [addr for addr in tracked if addr not in addresses]:
+                del tracked[address]
+
+        intervals = {
+            address: self.interval(address, distances.get(address))
+            for address in addresses
+            if address != SOL_TOKEN_ADDRESS
+        }
+        if SOL_TOKEN_ADDRESS in addresses:
+            intervals[SOL_TOKEN_ADDRESS] = min(intervals.values(), default=self.max_interval)
+        self.intervals = intervals
+
+        # Without SOL no tick can evaluate anything, so it always goes first.
+        due: list[Tuple[bool, float, str]] = []
+        for address, interval in intervals.items():
+            polled_at = self.last_polled.get(address)
+            if polled_at is None:
+                overdue = math.inf
+            elif now - polled_at >= interval:
+                overdue = (now - polled_at) / interval
+            else:
+                continue
+            due.append((address == SOL_TOKEN_ADDRESS, overdue, address))
+        due.sort(reverse=True)
+        selected = [address for _, _, address in due]
+
+        if self.budget > 0:
+            if self.refilled_at is not None:
+                self.allowance = min(
+                    self.capacity,
+                    self.allowance + (now - self.refilled_at) * self.budget,
+                )
+            self.refilled_at = now
+            selected = selected[: int(self.allowance) * max(1, batch_size)]
+            self.allowance -= math.ceil(len(selected) / max(1, batch_size))
+
+        self.due = len(due)
+        self.deferred = len(due) - len(selected)
+        self.requests += math.ceil(len(selected) / max(1, batch_size))
+        return selected
+
+    def seconds_until_due(self, now: Optional[float] = None) -> float:
+        """Time until the next token falls due or the budget frees a request."""
+        now = time.monotonic() if now is None else now
+        wait = self.max_interval
+        for address, interval in self.intervals.items():
+            polled_at = self.last_polled.get(address)
+            wait = min(wait, 0.0 if polled_at is None else polled_at + interval - now)
+        if self.budget > 0 and self.allowance < 1:
+            wait = max(wait, (1 - self.allowance) / self.budget)
+        return max(0.0, wait)
+
+    def stats(self) -> Dict[str, float]:
+        intervals = sorted(self.intervals.values())
+        return {
+            "tokens": len(intervals),
+            "due": self.due,
+            "deferred": self.deferred,
+            "requests": self.requests,
+            "min_interval": intervals[0] if intervals else 0.0,
+            "median_interval": intervals[len(intervals) // 2] if intervals else 0.0,
+        }
+
+
+def _same(current: object, value: object) -> bool:
+    # NaN never equals itself; an unchanged NaN field is still unchanged.
+    return current == value or (current != current and value != value)
+
+
+class PositionRecord:
+    """One open position, parsed once from its trading_positions row.
+
+    Numbers are converted (leverage and collateral clamped the way
+    `evaluate_position` needs them) and the direction is kept as `is_long`, so
+    evaluating a record costs no parsing. The book updates records in place.
+    """
+
+    __slots__ = (
+        "id",
+        "wallet_address",
+        "token_address",
+        "token_symbol",
+        "is_long",
+        "entry_price",
+        "liquidation_price",
+        "amount",
+        "leverage",
+        "collateral_sol",
+        "status",
+        "updated_at",
+    )
+
+    def __init__(self, row: dict) -> None:
+        for name, value in zip(self.__slots__, self._parse(row)):
+            setattr(self, name, value)
+
+    @staticmethod
+    def _parse(row: dict) -> tuple:
+        return (
+            row.get("id"),
+            row.get("wallet_address"),
+            row.get("token_address"),
+            row.get("token_symbol"),
+            (row.get("direction") or "Long").capitalize() == "Long",
+            to_float(row.get("entry_price")),
+            to_float(row.get("liquidation_price")),
+            to_float(row.get("amount")),
+            max(1.0, to_float(row.get("leverage"), 1.0)),
+            max(0.0, to_float(row.get("collateral_sol"))),
+            row.get("status"),
+            row.get("updated_at"),
+        )
+
+    def update(self, row: dict) -> bool:
+        """Overwrite from a newer row; returns whether any field changed."""
+        changed = False
+        for name, value in zip(self.__slots__, self._parse(row)):
+            if not _same(getattr(self, name), value):
+                setattr(self, name, value)
+                changed = True
+        return changed
+
+    @property
+    def direction(self) -> str:
+        return "Long" if self.is_long else "Short"
+
+    def as_row(self) -> dict:
+        row = {name: getattr(self, name) for name in self.__slots__}
+        del row["is_long"]
+        row["direction"] = self.direction
+        return row
+
+
+class PositionBook:
+    """Resident set of open positions keyed by id.
+
+    Seeded from a full scan, then kept current by applying only the rows whose
+    `updated_at` moved past `cursor`. Rows that leave the open statuses are
+    evicted. Each position is held as one PositionRecord for its lifetime and
+    is also grouped by token in `by_token`, so a single token's positions can be
+    read without scanning the book.
+    """
+
+    def __init__(self) -> None:
+        self.positions: Dict[object, PositionRecord] = {}
+        self.by_token: Dict[Optional[str], Dict[object, PositionRecord]] = {}
+        self.cursor: Optional[datetime] = None
+        self.last_full_sync: Optional[float] = None
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def values(self) -> list[PositionRecord]:
+        return list(self.positions.values())
+
+    def for_tokens(self, token_addresses: Iterable[str]) -> list[PositionRecord]:
+        """Open positions on any of `token_addresses`."""
+        found: list[PositionRecord] = []
+        for token_address in token_addresses:
+            found.extend(self.by_token.get(token_address, {}).values())
+        return found
+
+    def needs_full_sync(self, now: Optional[float] = None) -> bool:
+        if self.last_full_sync is None:
+            return True
+        now = time.monotonic() if now is None else now
+        return now - self.last_full_sync >= POSITION_RESYNC_SECONDS
+
+    def replace(self, rows: Iterable[dict], now: Optional[float] = None) -> None:
+        self.positions = {}
+        self.by_token = {}
+        self.cursor = None
+        self.apply(rows)
+        self.last_full_sync = time.monotonic() if now is None else now
+        self.version += 1
+
+    def apply(
+        self,
+        rows: Iterable[dict],
+        advance_cursor: bool = True,
+    ) -> Tuple[list[PositionRecord], list[object]]:
+        """Upsert open rows and evict everything else.
+
+        Returns (records added or changed, evicted ids). Pushed rows pass
+        `advance_cursor=False`: the cursor only tracks what the REST sync has
+        read, so a push never lets it skip a missed row.
+        """
+        upserted: list[PositionRecord] = []
+        evicted: list[object] = []
+        for row in rows:
+            position_id = row.get("id")
+            if position_id is None:
+                continue
+
+            if advance_cursor:
+                updated_at = parse_timestamp(row.get("updated_at"))
+                if updated_at and (self.cursor is None or updated_at > self.cursor):
+                    self.cursor = updated_at
+
+            if row.get("status") in OPEN_POSITION_STATUSES:
+                held = self.positions.get(position_id)
+                if held is None:
+                    held = self.positions[position_id] = PositionRecord(row)
+                    self._group(held)
+                    upserted.append(held)
+                else:
+                    token_address = held.token_address
+                    # Lookback re-reads return unchanged rows; keep those as-is.
+                    if held.update(row):
+                        if held.token_address != token_address:
+                            self._ungroup(position_id, token_address)
+                            self._group(held)
+                        upserted.append(held)
+            elif self._remove(position_id):
+                evicted.append(position_id)
+        if upserted or evicted:
+            self.version += 1
+        return upserted, evicted
+
+    def discard(self, position_id: object) -> None:
+        if self._remove(position_id):
+            self.version += 1
+
+    def _remove(self, position_id: object) -> bool:
+        held = self.positions.pop(position_id, None)
+        if held is None:
+            return False
+        self._ungroup(position_id, held.token_address)
+        return True
+
+    def _group(self, position: PositionRecord) -> None:
+        self.by_token.setdefault(position.token_address, {})[position.id] = position
+
+    def _ungroup(self, position_id: object, token_address: Optional[str]) -> None:
+        group = self.by_token.get(token_address)
+        if group is not None:
+            group.pop(position_id, None)
+            if not group:
+                del self.by_token[token_address]
+
+    def invalidate(self) -> None:
+        """Force a full resync on the next sync."""
+        self.last_full_sync = None
+
+
+class PositionColumns:
+    """Open positions laid out as NumPy columns.
+
+    `evaluate` mirrors `LiquidationWatcher.evaluate_position` operation for
+    operation, so results are bit-identical to the scalar path.
+    """
+
+    def __init__(self, positions: Iterable[PositionRecord]) -> None:
+        rows = [pos for pos in positions if pos.token_address]
+        count = len(rows)
+        self.positions = rows
+        self.tokens: list[str] = list(dict.fromkeys(pos.token_address for pos in rows))
+        token_index = {address: idx for idx, address in enumerate(self.tokens)}
+
+        self.token_idx = np.fromiter(
+            (token_index[pos.token_address] for pos in rows),
+            dtype=np.intp,
+            count=count,
+        )
+        self.is_long = np.fromiter((pos.is_long for pos in rows), dtype=bool, count=count)
+        # Records already hold clamped leverage and collateral.
+        self.entry_price = self._column(rows, "entry_price")
+        self.liquidation_price = self._column(rows, "liquidation_price")
+        self.amount = self._column(rows, "amount")
+        self.leverage = self._column(rows, "leverage")
+        self.collateral_sol = self._column(rows, "collateral_sol")
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @staticmethod
+    def _column(rows: list[PositionRecord], field: str):
+        return np.fromiter(
+            (getattr(pos, field) for pos in rows),
+            dtype=np.float64,
+            count=len(rows),
+        )
+
+    def evaluate(self, price_map: Dict[str, float], sol_price: float):
+        """Return (current_price, should_liquidate, pnl_usd, margin_ratio) arrays.
+
+        Positions whose token has no price are never flagged.
+        """
+        count = len(self.positions)
+        token_prices = np.array(
+            [price_map.get(address, np.nan) for address in self.tokens],
+            dtype=np.float64,
+        )
+        token_priced = np.array(
+            [address in price_map for address in self.tokens],
+            dtype=bool,
+        )
+        current = token_prices[self.token_idx]
+        priced = token_priced[self.token_idx]
+
+        with np.errstate(all="ignore"):
+            long_pnl = (current - self.entry_price) * self.amount * self.leverage
+            short_pnl = (self.entry_price - current) * self.amount * self.leverage
+            pnl_usd = np.where(self.is_long, long_pnl, short_pnl)
+            price_triggered = np.where(
+                self.is_long,
+                current <= self.liquidation_price,
+                current >= self.liquidation_price,
+            )
+
+            if sol_price > 0:
+                pnl_sol = pnl_usd / sol_price
+            else:
+                pnl_sol = np.zeros(count)
+
+            margin_ratio = np.zeros(count)
+            np.divide(
+                np.abs(pnl_sol),
+                self.collateral_sol,
+                out=margin_ratio,
+                where=(pnl_sol < 0) & (self.collateral_sol > 0),
+            )
+            margin_ratio = np.where(margin_ratio > 1.0, 1.0, margin_ratio)
+
+        margin_triggered = margin_ratio >= MARGIN_LIQUIDATION_RATIO
+        should_liquidate = (price_triggered | margin_triggered) & priced
+        return current, should_liquidate, pnl_usd, margin_ratio
+
+
+def trigger_price(position: PositionRecord, sol_price: float) -> Optional[Tuple[bool, float]]:
+    """Return (is_long, price) at which the position first becomes liquidatable.
+
+    This is the tighter of the stored liquidation price and the price where
+    `margin_ratio` reaches MARGIN_LIQUIDATION_RATIO at `sol_price`. Returns None
+    for rows whose numbers do not allow a monotonic trigger; those have to be
+    evaluated every tick.
+    """
+    is_long = position.is_long
+    entry_price = position.entry_price
+    liquidation_price = position.liquidation_price
+    amount = position.amount
+    leverage = position.leverage
+    collateral_sol = position.collateral_sol
+
+    values = (entry_price, liquidation_price, amount, leverage, collateral_sol)
+    if not all(math.isfinite(value) for value in values):
+        return None
+    size = amount * leverage
+    if size <= 0:
+        return None
+
+    if collateral_sol > 0 and sol_price > 0:
+        offset = MARGIN_LIQUIDATION_RATIO * collateral_sol * sol_price / size
+    else:
+        offset = math.inf
+
+    # Widen slightly so rounding never hides a breach; candidates are re-checked
+    # with evaluate_position anyway.
+    if is_long:
+        price = max(liquidation_price, entry_price - offset)
+        price += abs(price) * 1e-9 + 1e-12
+    else:
+        price = min(liquidation_price, entry_price + offset)
+        price -= abs(price) * 1e-9 + 1e-12
+    return is_long, price
+
+
+class ThresholdIndex:
+    """Per-token sorted trigger prices, longs and shorts kept apart.
+
+    A long is at risk once the token price is at or below its trigger, a short
+    once it is at or above, so the crossed set is a single bisect per side.
+    Margin triggers depend on SOL; they are computed at the bottom of a band
+    around the reference SOL price (the conservative side for both directions)
+    and the index is rebuilt once SOL leaves that band.
+    """
+
+    def __init__(self, sol_band: float = THRESHOLD_INDEX_SOL_BAND) -> None:
+        self.sol_band = sol_band
+        self.sol_ref: Optional[float] = None
+        self.sides: Dict[Tuple[str, bool], Tuple[list[float], list[object]]] = {}
+        self.entries: Dict[object, Tuple[str, bool, float]] = {}
+        self.unindexed: Dict[object, PositionRecord] = {}
+        self.positions: Dict[object, PositionRecord] = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def needs_rebuild(self, sol_price: float) -> bool:
+        if self.sol_ref is None:
+            return True
+        return not (
+            self.sol_ref * (1 - self.sol_band)
+            <= sol_price
+            <= self.sol_ref * (1 + self.sol_band)
+        )
+
+    def invalidate(self) -> None:
+        self.sol_ref = None
+
+    def rebuild(self, positions: Iterable[PositionRecord], sol_price: float) -> None:
+        self.sol_ref = sol_price
+        self.sides = {}
+        self.entries = {}
+        self.unindexed = {}
+        self.positions = {}
+
+        unsorted: Dict[Tuple[str, bool], list[Tuple[float, object]]] = {}
+        for position in positions:
+            placed = self._place(position)
+            if placed is not None:
+                key, price, position_id = placed
+                unsorted.setdefault(key, []).append((price, position_id))
+
+        for key, levels in unsorted.items():
+            levels.sort(key=lambda level: level[0])
+            self.sides[key] = ([lvl[0] for lvl in levels], [lvl[1] for lvl in levels])
+
+    def apply(self, upserted: Iterable[PositionRecord], evicted: Iterable[object]) -> None:
+        """Follow a PositionBook.apply: re-place changed records, drop evicted ids."""
+        if self.sol_ref is None:
+            return
+        for position in upserted:
+            self.upsert(position)
+        for position_id in evicted:
+            self.remove(position_id)
+
+    def upsert(self, position: PositionRecord) -> None:
+        # Records change in place, so there is no old copy to compare against;
+        # the book only hands over records that actually changed.
+        if self.sol_ref is None:
+            return
+        self.remove(position.id)
+        placed = self._place(position)
+        if placed is None:
+            return
+        key, price, position_id = placed
+        prices, ids = self.sides.setdefault(key, ([], []))
+        idx = bisect.bisect_right(prices, price)
+        prices.insert(idx, price)
+        ids.insert(idx, position_id)
+
+    def remove(self, position_id: object) -> None:
+        self.positions.pop(position_id, None)
+        self.unindexed.pop(position_id, None)
+        entry = self.entries.pop(position_id, None)
+        if entry is None:
+            return
+        token_address, is_long, price = entry
+        prices, ids = self.sides[(token_address, is_long)]
+        idx = bisect.bisect_left(prices, price)
+        while idx < len(ids) and ids[idx] != position_id:
+            idx += 1
+        if idx < len(ids):
+            del prices[idx]
+            del ids[idx]
+
+    def candidates(self, price_map: Dict[str, float]) -> list[PositionRecord]:
+        """Positions whose trigger the current token prices have crossed."""
+        hits: list[PositionRecord] = []
+        for (token_address, is_long), (prices, ids) in self.sides.items():
+            current_price = price_map.get(token_address)
+            if current_price is None:
+                continue
+            if is_long:
+                crossed = ids[bisect.bisect_left(prices, current_price):]
+            else:
+                crossed = ids[:bisect.bisect_right(prices, current_price)]
+            hits.extend(self.positions[position_id] for position_id in crossed)
+
+        hits.extend(
+            position
+            for position in self.unindexed.values()
+            if position.token_address in price_map
+        )
+        return hits
+
+    def trigger_distances(self, price_map: Dict[str, float]) -> Dict[str, float]:
+        """Relative price move each token needs before its nearest trigger is crossed.
+
+        Tokens holding unindexed positions report 0 so they are always treated
+        as at risk.
+        """
+        distances: Dict[str, float] = {}
+        for (token_address, is_long), (prices, _) in self.sides.items():
+            current_price = price_map.get(token_address)
+            if not prices or current_price is None or current_price <= 0:
+                continue
+            if is_long:
+                gap = (current_price - prices[-1]) / current_price
+            else:
+                gap = (prices[0] - current_price) / current_price
+            distances[token_address] = min(
+                distances.get(token_address, math.inf),
+                max(0.0, gap),
+            )
+        for position in self.unindexed.values():
+            if position.token_address:
+                distances[position.token_address] = 0.0
+        return distances
+
+    def _place(self, position: PositionRecord) -> Optional[Tuple[Tuple[str, bool], float, object]]:
+        position_id = position.id
+        token_address = position.token_address
+        if position_id is None or not token_address:
+            return None
+
+        self.positions[position_id] = position
+        trigger = trigger_price(position, self.sol_ref * (1 - self.sol_band))
+        if trigger is None or math.isnan(trigger[1]):
+            self.unindexed[position_id] = position
+            return None
+
+        is_long, price = trigger
+        self.entries[position_id] = (token_address, is_long, price)
+        return (token_address, is_long), price, position_id
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+def assign_buckets(
+    worker_ids: Iterable[str],
+    buckets: int = SHARD_BUCKETS,
+    vnodes: int = SHARD_VNODES,
+) -> Dict[str, frozenset]:
+    """Map token_shard buckets onto workers with a consistent hash ring.
+
+    Every worker computes this from the same live-worker list, so they agree on
+    ownership without talking to each other; adding or losing a worker only
+    moves the buckets adjacent to its ring points.
+    """
+    ring = sorted(
+        (ring_hash(f"{worker_id}#{vnode}"), worker_id)
+        for worker_id in set(worker_ids)
+        for vnode in range(vnodes)
+    )
+    if not ring:
+        return {}
+
+    points = [point for point, _ in ring]
+    owned: Dict[str, set] = {worker_id: set() for _, worker_id in ring}
+    for bucket in range(buckets):
+        idx = bisect.bisect_left(points, ring_hash(f"bucket:{bucket}")) % len(ring)
+        owned[ring[idx][1]].add(bucket)
+    return {worker_id: frozenset(found) for worker_id, found in owned.items()}
+
+
+class ShardCoordinator:
+    """Lease-based ownership of a slice of token_shard buckets.
+
+    Each heartbeat renews this worker's lease and returns the live workers; the
+    owned buckets are recomputed from that list. If heartbeats keep failing for
+    a whole lease, the worker gives up its buckets because the others will
+    already have taken them over.
+    """
+
+    def __init__(self, worker_id: str = SHARD_WORKER_ID) -> None:
+        self.worker_id = worker_id
+        self.owned: frozenset = frozenset()
+        self.workers: Tuple[str, ...] = ()
+        self.last_heartbeat: Optional[float] = None
+        self.last_attempt: Optional[float] = None
+
+    def position_filter(self) -> Dict[str, str]:
+        buckets = ",".join(str(bucket) for bucket in sorted(self.owned))
+        return {"token_shard": f"in.({buckets})"}
+
+    def owns(self, row: dict) -> Optional[bool]:
+        """Whether a pushed row falls in this worker's buckets (None if unknown)."""
+        bucket = row.get("token_shard")
+        if bucket is None:
+            return None
+        return int(bucket) in self.owned
+
+    async def maybe_heartbeat(self, session: ClientSession) -> bool:
+        """Renew the lease if due. Returns True when the owned buckets changed."""
+        now = time.monotonic()
+        if self.last_attempt is not None and now - self.last_attempt < SHARD_HEARTBEAT_SECONDS:
+            return False
+        self.last_attempt = now
+
+        previous = self.owned
+        try:
+            workers = await self.heartbeat(session)
+        except Exception as exc:
+            logger.warning("Shard heartbeat failed: %s", exc)
+            if self.last_heartbeat is None or now - self.last_heartbeat >= SHARD_LEASE_SECONDS:
+                self.owned = frozenset()
+        else:
+            self.last_heartbeat = now
+            if self.worker_id not in workers:
+                workers = (*workers, self.worker_id)
+            if workers != self.workers:
+                logger.info("Shard membership: %s", ", ".join(workers))
+            self.workers = workers
+            self.owned = assign_buckets(workers).get(self.worker_id, frozenset())
+
+        if self.owned != previous:
+            logger.info(
+                "Worker %s now owns %s/%s token shard bucket(s).",
+                self.worker_id,
+                len(self.owned),
+                SHARD_BUCKETS,
+            )
+            return True
+        return False
+
+    async def heartbeat(self, session: ClientSession) -> Tuple[str, ...]:
+        url = f"{SUPABASE_REST_URL}/rpc/liquidation_worker_heartbeat"
+        payload = {"p_worker_id": self.worker_id, "p_lease_seconds": SHARD_LEASE_SECONDS}
+        async with session.post(url, headers=SUPABASE_HEADERS, json=payload) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise RuntimeError(f"Heartbeat failed ({resp.status}): {text}")
+            rows = await read_json(resp) or []
+        return tuple(sorted(row["worker_id"] for row in rows if row.get("worker_id")))
+
+    async def release(self, session: ClientSession) -> None:
+        """Drop this worker's lease so its buckets move immediately."""
+        url = f"{SUPABASE_REST_URL}/liquidation_workers"
+        params = {"worker_id": f"eq.{self.worker_id}"}
+        try:
+            async with session.delete(url, headers=SUPABASE_HEADERS, params=params) as resp:
+                if resp.status not in (200, 204):
+                    text = await resp.text()
+                    raise RuntimeError(f"{resp.status} {text}")
+        except Exception as exc:
+            logger.warning("Failed to release shard lease: %s", exc)
+        self.owned = frozenset()
+
+
+class PriceStream(abc.ABC):
+    """Push price feed used by streaming mode.
+
+    Implementations connect once, accept subscription changes at any time and
+    yield (token_address, price) pairs from `updates` until the feed drops, at
+    which point the watcher reconnects and re-subscribes.
+    """
+
+    @abc.abstractmethod
+    async def connect(self, session: ClientSession) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def subscribe(self, addresses: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def unsubscribe(self, addresses: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def updates(self) -> AsyncIterator[Tuple[str, float]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        raise NotImplementedError
+
+
+class BirdeyePriceStream(PriceStream):
+    """Birdeye websocket price feed (SUBSCRIBE_PRICE / PRICE_DATA messages).
+
+    Any server speaking the same messages works, so a local stand-in can be
+    pointed at with `url`.
+    """
+
+    def __init__(self, url: str = BIRDEYE_WS_URL, api_key: str = BIRDEYE_API_KEY) -> None:
+        self.url = url
+        self.api_key = api_key
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+
+    async def connect(self, session: ClientSession) -> None:
+        await self.close()
+        self.ws = await session.ws_connect(
+            self.url,
+            params={"x-api-key": self.api_key} if self.api_key else None,
+            protocols=("echo-protocol",),
+            heartbeat=30,
+        )
+
+    async def subscribe(self, addresses: Iterable[str]) -> None:
+        await self._send("SUBSCRIBE_PRICE", addresses)
+
+    async def unsubscribe(self, addresses: Iterable[str]) -> None:
+        await self._send("UNSUBSCRIBE_PRICE", addresses)
+
+    async def _send(self, message_type: str, addresses: Iterable[str]) -> None:
+        if self.ws is None or self.ws.closed:
+            return
+        for address in addresses:
+            await self.ws.send_json(
+                {
+                    "type": message_type,
+                    "data": {
+                        "queryType": "simple",
+                        "chartType": "1m",
+                        "address": address,
+                        "currency": "usd",
+                    },
+                }
+            )
+
+    async def updates(self) -> AsyncIterator[Tuple[str, float]]:
+        if self.ws is None:
+            return
+        async for message in self.ws:
+            if message.type == aiohttp.WSMsgType.ERROR:
+                raise RuntimeError(f"Price stream error: {self.ws.exception()}")
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            try:
+                payload = loads(message.data)
+            except ValueError:
+                continue
+            if payload.get("type") != "PRICE_DATA":
+                continue
+            data = payload.get("data") or {}
+            address = data.get("address")
+            price = data.get("c", data.get("value"))
+            if address and price is not None:
+                yield address, float(price)
+
+    async def close(self) -> None:
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.close()
+        self.ws = None
+
+
+class PositionFeed(abc.ABC):
+    """Push feed of trading_positions row changes used by change-feed mode.
+
+    `changes` yields (change type, row, commit time) until the feed drops, at
+    which point the watcher reconnects. Rows are applied on top of the REST
+    sync, which stays the source of truth.
+    """
+
+    @abc.abstractmethod
+    async def connect(self, session: ClientSession) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def changes(self) -> AsyncIterator[Tuple[str, dict, Optional[datetime]]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        raise NotImplementedError
+
+
+class SupabaseRealtimeFeed(PositionFeed):
+    """Supabase Realtime `postgres_changes` on trading_positions.
+
+    Realtime reads the table through logical replication and relays each
+    committed row over a Phoenix channel websocket. Any server speaking the
+    same messages works, so a local stand-in can be pointed at with `url`.
+    """
+
+    HEARTBEAT_SECONDS = 25.0
+
+    def __init__(self, url: Optional[str] = None, api_key: Optional[str] = None) -> None:
+        self.url = url or SUPABASE_REALTIME_URL
+        self.api_key = api_key or SUPABASE_SERVICE_ROLE_KEY
+        self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self.ref = 0
+
+    async def connect(self, session: ClientSession) -> None:
+        await self.close()
+        self.ws = await session.ws_connect(
+            self.url,
+            params={"apikey": self.api_key, "vsn": "1.0.0"},
+        )
+        await self._send(
+            "realtime:trading_positions",
+            "phx_join",
+            {
+                "config": {
+                    "postgres_changes": [
+                        {"event": "*", "schema": "public", "table": "trading_positions"}
+                    ]
+                },
+                "access_token": self.api_key,
+            },
+        )
+
+    async def _send(self, topic: str, event: str, payload: dict) -> None:
+        self.ref += 1
+        await self.ws.send_json(
+            {"topic": topic, "event": event, "payload": payload, "ref": str(self.ref)}
+        )
+
+    async def changes(self) -> AsyncIterator[Tuple[str, dict, Optional[datetime]]]:
+        if self.ws is None:
+            return
+        last_heartbeat = time.monotonic()
+        while True:
+            wait = max(0.0, last_heartbeat + self.HEARTBEAT_SECONDS - time.monotonic())
+            try:
+                message = await self.ws.receive(timeout=wait)
+            except asyncio.TimeoutError:
+                message = None
+            if time.monotonic() - last_heartbeat >= self.HEARTBEAT_SECONDS:
+                await self._send("phoenix", "heartbeat", {})
+                last_heartbeat = time.monotonic()
+            if message is None:
+                continue
+            if message.type in (
+                aiohttp.WSMsgType.CLOSE,
+                aiohttp.WSMsgType.CLOSING,
+                aiohttp.WSMsgType.CLOSED,
+            ):
+                return
+            if message.type == aiohttp.WSMsgType.ERROR:
+                raise RuntimeError(f"Position feed error: {self.ws.exception()}")
+            if message.type != aiohttp.WSMsgType.TEXT:
+                continue
+            try:
+                envelope = loads(message.data)
+            except ValueError:
+                continue
+
+            event = envelope.get("event")
+            payload = envelope.get("payload") or {}
+            if event == "phx_reply" and payload.get("status") == "error":
+                raise RuntimeError(f"Position feed rejected: {payload.get('response')}")
+            if event == "phx_error":
+                raise RuntimeError("Position feed channel crashed")
+            if event != "postgres_changes":
+                continue
+
+            data = payload.get("data") or {}
+            change_type = str(data.get("type") or "").upper()
+            if change_type == "DELETE":
+                old = data.get("old_record") or {}
+                row = {"id": old.get("id"), "status": "deleted"}
+            else:
+                record = data.get("record") or {}
+                row = {column: record[column] for column in POSITION_COLUMNS if column in record}
+                if "token_shard" in record:
+                    row["token_shard"] = record["token_shard"]
+            if row.get("id") is not None:
+                yield change_type, row, parse_timestamp(data.get("commit_timestamp"))
+
+    async def close(self) -> None:
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.close()
+        self.ws = None
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker for one price source.
+
+    After `failures` failed calls in a row the source is skipped for `cooldown`
+    seconds, then a single trial call is let through: success closes the
+    breaker, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failures: int = PRICE_SOURCE_FAILURES,
+        cooldown: float = PRICE_SOURCE_COOLDOWN_SECONDS,
+    ) -> None:
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_inflight = False
+
+    def state(self, now: Optional[float] = None) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        now = time.monotonic() if now is None else now
+        return self.HALF_OPEN if now - self.opened_at >= self.cooldown else self.OPEN
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        state = self.state(now)
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self.trial_inflight:
+            self.trial_inflight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_inflight = False
+
+    def record_failure(self, now: Optional[float] = None) -> None:
+        self.consecutive_failures += 1
+        if self.trial_inflight or self.consecutive_failures >= self.failures:
+            self.opened_at = time.monotonic() if now is None else now
+        self.trial_inflight = False
+
+
+class PriceSource(abc.ABC):
+    """REST price provider used by `LiquidationWatcher.fetch_token_prices`.
+
+    `fetch` returns USD prices for whichever addresses resolved and reports
+    partial results through `on_prices` as they arrive. Raising, or resolving
+    nothing, counts as a failed call for the source's circuit breaker.
+    """
+
+    name = "source"
+
+    @abc.abstractmethod
+    async def fetch(
+        self,
+        session: ClientSession,
+        addresses: list[str],
+        on_prices: Optional[Callable[[Dict[str, float]], None]] = None,
+    ) -> Dict[str, float]:
+        raise NotImplementedError
+
+
+class BirdeyePriceSource(PriceSource):
+    """Birdeye through the watcher's own batching, retry and hedging logic."""
+
+    name = "birdeye"
+
+    def __init__(self, watcher: "LiquidationWatcher") -> None:
+        self.watcher = watcher
+
+    async def fetch(
+        self,
+        session: ClientSession,
+        addresses: list[str],
+        on_prices: Optional[Callable[[Dict[str, float]], None]] = None,
+    ) -> Dict[str, float]:
+        return await self.watcher.fetch_birdeye_prices(session, addresses, on_prices)
+
+
+class BatchedPriceSource(PriceSource):
+    """Provider queried with comma-separated address chunks."""
+
+    batch_size = 50
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+
+    async def fetch(
+        self,
+        session: ClientSession,
+        addresses: list[str],
+        on_prices: Optional[Callable[[Dict[str, float]], None]] = None,
+    ) -> Dict[str, float]:
+        sem = asyncio.Semaphore(max(1, PRICE_SOURCE_CONCURRENCY))
+
+        async def fetch_chunk(chunk: Tuple[str, ...]) -> Dict[str, float]:
+            async with sem:
+                return await self.fetch_chunk(session, chunk)
+
+        tasks = [
+            asyncio.create_task(fetch_chunk(chunk))
+            for chunk in chunked(addresses, self.batch_size)
+        ]
+        prices: Dict[str, float] = {}
+        errors: list[Exception] = []
+        try:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    chunk_prices = await task
+                except Exception as exc:
+                    errors.append(exc)
+                    continue
+                prices.update(chunk_prices)
+                if on_prices is not None and chunk_prices:
+                    on_prices(chunk_prices)
+        finally:
+            for task in tasks:
+                task.cancel()
+        if errors and not prices:
+            raise errors[0]
+        return prices
+
+    @abc.abstractmethod
+    async def fetch_chunk(
+        self,
+        session: ClientSession,
+        chunk: Tuple[str, ...],
+    ) -> Dict[str, float]:
+        raise NotImplementedError
+
+
+class JupiterPriceSource(BatchedPriceSource):
+    """Jupiter price API (`?ids=a,b`); accepts both the v3 and v2 response shapes."""
+
+    name = "jupiter"
+    batch_size = 50
+
+    def __init__(self, url: Optional[str] = None) -> None:
+        super().__init__(url or JUPITER_PRICE_ENDPOINT)
+
+    async def fetch_chunk(
+        self,
+        session: ClientSession,
+        chunk: Tuple[str, ...],
+    ) -> Dict[str, float]:
+        async with session.get(self.url, params={"ids": ",".join(chunk)}) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise RuntimeError(f"Jupiter {resp.status}: {text}")
+            payload = await read_json(resp) or {}
+
+        data = payload.get("data", payload) if isinstance(payload, dict) else {}
+        prices: Dict[str, float] = {}
+        for address in chunk:
+            entry = data.get(address)
+            if not isinstance(entry, dict):
+                continue
+            value = to_float(entry.get("usdPrice", entry.get("price")), math.nan)
+            if math.isfinite(value) and value > 0:
+                prices[address] = value
+        return prices
+
+
+class DexScreenerPriceSource(BatchedPriceSource):
+    """DexScreener token pairs; each token takes its most liquid pair's USD price."""
+
+    name = "dexscreener"
+    batch_size = 30
+
+    def __init__(self, url: Optional[str] = None) -> None:
+        super().__init__(url or DEXSCREENER_TOKENS_ENDPOINT)
+
+    async def fetch_chunk(
+        self,
+        session: ClientSession,
+        chunk: Tuple[str, ...],
+    ) -> Dict[str, float]:
+        async with session.get(f"{self.url}/{','.join(chunk)}") as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise RuntimeError(f"DexScreener {resp.status}: {text}")
+            pairs = await read_json(resp) or []
+
+        if isinstance(pairs, dict):
+            pairs = pairs.get("pairs") or []
+        wanted = set(chunk)
+        best: Dict[str, Tuple[float, float]] = {}
+        for pair in pairs:
+            address = (pair.get("baseToken") or {}).get("address")
+            if address not in wanted:
+                continue
+            value = to_float(pair.get("priceUsd"), math.nan)
+            liquidity = to_float((pair.get("liquidity") or {}).get("usd"))
+            if not (math.isfinite(value) and value > 0):
+                continue
+            if address not in best or liquidity > best[address][0]:
+                best[address] = (liquidity, value)
+        return {address: value for address, (_, value) in best.items()}
+
+
+class WatcherMetrics:
+    """Per-tick instrumentation exposed on /metrics and in the periodic summary."""
+
+    PHASES = ("sync_positions", "fetch_prices", "evaluate", "write")
+
+    def __init__(self) -> None:
+        self.registry = MetricsRegistry()
+        registry = self.registry
+        self.tick_seconds = registry.histogram(
+            "liquidation_tick_seconds", "Wall time of a full polling tick."
+        )
+        self.phase_seconds = registry.histogram(
+            "liquidation_tick_phase_seconds",
+            "Wall time of each tick phase. SOL is priced inside fetch_prices.",
+            ("phase",),
+        )
+        self.tick_overruns = registry.counter(
+            "liquidation_tick_overruns_total", "Ticks that took longer than POLL_SECONDS."
+        )
+        self.birdeye_seconds = registry.histogram(
+            "liquidation_birdeye_request_seconds",
+            "Latency of individual Birdeye HTTP requests.",
+            ("endpoint",),
+        )
+        self.birdeye_retries = registry.counter(
+            "liquidation_birdeye_retries_total",
+            "Per-token price fetch retries.",
+            ("token",),
+        )
+        self.birdeye_errors = registry.counter(
+            "liquidation_birdeye_errors_total",
+            "Failed Birdeye requests by token (batch failures use token=\"batch\").",
+            ("token",),
+        )
+        self.position_feed_changes = registry.counter(
+            "liquidation_position_feed_changes_total",
+            "Pushed trading_positions changes by type (INSERT, UPDATE, DELETE, ignored).",
+            ("type",),
+        )
+        self.position_feed_lag_seconds = registry.histogram(
+            "liquidation_position_feed_lag_seconds",
+            "Time from a position change committing to the watcher applying it.",
+        )
+        self.price_source_seconds = registry.histogram(
+            "liquidation_price_source_seconds",
+            "Latency of each price source call.",
+            ("source",),
+        )
+        self.price_source_calls = registry.counter(
+            "liquidation_price_source_calls_total",
+            "Price source calls by outcome (ok, empty, error, skipped by breaker).",
+            ("source", "outcome"),
+        )
+        self.price_source_state = registry.gauge(
+            "liquidation_price_source_breaker_open",
+            "1 while a source's circuit breaker is open or half-open.",
+            ("source",),
+        )
+        self.price_source_wins = registry.counter(
+            "liquidation_price_source_quotes_used_total",
+            "Token prices taken from each source (first mode) or agreeing in the median.",
+            ("source",),
+        )
+        self.price_source_disagreements = registry.counter(
+            "liquidation_price_source_disagreements_total",
+            "Tokens left unpriced because the sources' quotes did not agree.",
+        )
+        self.birdeye_hedges = registry.counter(
+            "liquidation_birdeye_hedges_total",
+            "Hedged Birdeye requests: duplicates sent, and those that answered first.",
+            ("outcome",),
+        )
+        self.price_deadline_hits = registry.counter(
+            "liquidation_price_deadline_hits_total",
+            "Ticks whose price fetches outlived TICK_PRICE_DEADLINE_SECONDS.",
+        )
+        self.price_deadline_late = registry.counter(
+            "liquidation_price_deadline_late_total",
+            "Tokens still unpriced when the tick deadline expired.",
+            ("token",),
+        )
+        self.open_positions = registry.gauge(
+            "liquidation_open_positions", "Open positions in the position book."
+        )
+        self.distinct_tokens = registry.gauge(
+            "liquidation_distinct_tokens", "Distinct tokens across open positions."
+        )
+        self.breach_to_write_seconds = registry.histogram(
+            "liquidation_breach_to_write_seconds",
+            "Time from detecting a breach to its liquidation write completing.",
+        )
+        self.liquidation_writes = registry.counter(
+            "liquidation_writes_total", "Liquidation write outcomes.", ("outcome",)
+        )
+        self.price_cache = registry.gauge(
+            "liquidation_price_cache", "Price cache statistics.", ("stat",)
+        )
+        self.poll_scheduler = registry.gauge(
+            "liquidation_poll_scheduler",
+            "Adaptive polling statistics (intervals in seconds).",
+            ("stat",),
+        )
+        self.http_transport = registry.gauge(
+            "liquidation_http_transport",
+            "HTTP requests, connections opened and reused, and DNS cache lookups.",
+            ("stat",),
+        )
+
+    def summary(self) -> str:
+        phases = " ".join(
+            f"{phase}={self.phase_seconds.percentile(0.99, phase=phase) * 1000:.0f}ms"
+            for phase in self.PHASES
+        )
+        return (
+            f"ticks={self.tick_seconds.count()} "
+            f"tick_p50={self.tick_seconds.percentile(0.5) * 1000:.0f}ms "
+            f"tick_p99={self.tick_seconds.percentile(0.99) * 1000:.0f}ms "
+            f"overruns={self.tick_overruns.total():.0f} | p99 {phases} | "
+            f"positions={self.open_positions.total():.0f} "
+            f"tokens={self.distinct_tokens.total():.0f} "
+            f"birdeye_errors={self.birdeye_errors.total():.0f} "
+            f"retries={self.birdeye_retries.total():.0f} "
+            f"hedges={self.birdeye_hedges.value(outcome='sent'):.0f} "
+            f"deadline_hits={self.price_deadline_hits.total():.0f} "
+            f"open_breakers={self.price_source_state.total():.0f} "
+            f"conn_reuse={self.http_transport.value(stat='reuse_rate'):.2f} "
+            f"breach_to_write_p99={self.breach_to_write_seconds.percentile(0.99) * 1000:.0f}ms"
+        )
+
+
+class LiquidationWatcher:
+    def __init__(
+        self,
+        price_stream: Optional[PriceStream] = None,
+        shard: Optional[ShardCoordinator] = None,
+        price_sources: Optional[list[PriceSource]] = None,
+        position_feed: Optional[PositionFeed] = None,
+    ) -> None:
+        self.stop_event = asyncio.Event()
+        self.price_cache = PriceCache(
+            PRICE_CACHE_TTL_SECONDS,
+            PRICE_MAX_STALENESS_SECONDS,
+        )
+        self.refreshing: set[str] = set()
+        self.hedged_tokens: set[str] = set()
+        if price_sources is None:
+            price_sources = [self.make_price_source(name) for name in PRICE_SOURCES]
+        self.price_sources = price_sources
+        self.source_breakers = {source.name: CircuitBreaker() for source in price_sources}
+        self.scheduler: Optional[PollScheduler] = None
+        if ADAPTIVE_POLLING:
+            # A token must be re-polled before its cached price stops being usable.
+            self.scheduler = PollScheduler(
+                ADAPTIVE_MIN_INTERVAL_SECONDS,
+                min(ADAPTIVE_MAX_INTERVAL_SECONDS, PRICE_MAX_STALENESS_SECONDS),
+                ADAPTIVE_REQUEST_BUDGET,
+            )
+        self.last_position_sync: Optional[float] = None
+        self.transport_stats = TransportStats()
+        self.background_tasks: set[asyncio.Task] = set()
+        self.position_book = PositionBook()
+        self.columns: Optional[PositionColumns] = None
+        self.columns_version = -1
+        self.threshold_index = ThresholdIndex()
+        self.last_write_latencies: list[float] = []
+        self.inflight_liquidations: set = set()
+        if price_stream is None and STREAMING_PRICES:
+            price_stream = BirdeyePriceStream()
+        self.price_stream = price_stream
+        self.stream_subscriptions: set[str] = set()
+        if shard is None and SHARDING:
+            shard = ShardCoordinator()
+        self.shard = shard
+        if position_feed is None and POSITION_FEED:
+            position_feed = SupabaseRealtimeFeed()
+        self.position_feed = position_feed
+        self.metrics = WatcherMetrics()
+        self.recorder = TickRecorder(RECORD_PATH) if RECORD_PATH else None
+
+    def make_price_source(self, name: str) -> PriceSource:
+        if name == "birdeye":
+            return BirdeyePriceSource(self)
+        if name == "jupiter":
+            return JupiterPriceSource()
+        if name == "dexscreener":
+            return DexScreenerPriceSource()
+        raise ValueError(f"Unknown price source {name!r}")
+
+    def request_shutdown(self) -> None:
+        logger.warning("Shutdown signal received; draining in-flight tasks...")
+        self.stop_event.set()
+
+    async def run(self) -> None:
+        metrics_runner = await self.start_metrics_server()
+        session = create_session(
+            BIRDEYE_TIMEOUT_SECONDS + 2,
+            self.transport_stats,
+            pool_size=HTTP_POOL_SIZE,
+            pool_per_host=HTTP_POOL_PER_HOST,
+            keepalive=HTTP_KEEPALIVE_SECONDS,
+            dns_cache=HTTP_DNS_CACHE_SECONDS,
+            compression=HTTP_COMPRESSION,
+        )
+        async with session:
+            if self.price_stream is not None:
+                self.track_background(self.stream_prices(session))
+            if self.position_feed is not None:
+                self.track_background(self.stream_positions(session))
+            if METRICS_LOG_SECONDS > 0:
+                self.track_background(self.log_metrics_periodically())
+
+            while not self.stop_event.is_set():
+                started_at = time.monotonic()
+                try:
+                    await self.tick(session)
+                except Exception as exc:  # pragma: no cover - best-effort logging
+                    logger.exception("Tick failed: %s", exc)
+
+                elapsed = time.monotonic() - started_at
+                self.metrics.tick_seconds.observe(elapsed)
+                if elapsed > POLL_SECONDS:
+                    self.metrics.tick_overruns.inc()
+                    logger.debug("Tick overran poll interval: %.2fs", elapsed)
+                sleep_for = max(0.0, self.next_tick_interval(elapsed) - elapsed)
+                try:
+                    await asyncio.wait_for(self.stop_event.wait(), timeout=sleep_for)
+                except asyncio.TimeoutError:
+                    continue
+
+            await self.cancel_background_tasks()
+            if self.price_stream is not None:
+                await self.price_stream.close()
+            if self.position_feed is not None:
+                await self.position_feed.close()
+            if self.shard is not None:
+                await self.shard.release(session)
+
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def next_tick_interval(self, elapsed: float) -> float:
+        """Seconds between tick starts; adaptive polling wakes early for due tokens."""
+        if self.scheduler is None:
+            return POLL_SECONDS
+        due_in = elapsed + self.scheduler.seconds_until_due()
+        return min(POLL_SECONDS, max(ADAPTIVE_MIN_INTERVAL_SECONDS, due_in))
+
+    async def start_metrics_server(self):
+        if not METRICS_PORT:
+            return None
+        try:
+            runner = await serve_metrics(self.metrics.registry, METRICS_HOST, METRICS_PORT)
+        except OSError as exc:
+            logger.warning(
+                "Metrics endpoint unavailable on %s:%s: %s",
+                METRICS_HOST,
+                METRICS_PORT,
+                exc,
+            )
+            return None
+        logger.info("Serving metrics on http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+        return runner
+
+    async def log_metrics_periodically(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=METRICS_LOG_SECONDS)
+            except asyncio.TimeoutError:
+                logger.info("Metrics: %s", self.metrics.summary())
+
+    def track_background(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    async def cancel_background_tasks(self) -> None:
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        self.background_tasks.clear()
+
+    async def tick(self, session: ClientSession) -> None:
+        metrics = self.metrics
+        now = time.monotonic()
+        if (
+            self.scheduler is None
+            or self.last_position_sync is None
+            or now - self.last_position_sync >= POLL_SECONDS
+        ):
+            # Adaptive polling may tick faster than POLL_SECONDS; positions
+            # still sync at the regular cadence.
+            self.last_position_sync = now
+            with metrics.phase_seconds.time(phase="sync_positions"):
+                positions = await self.sync_positions(session)
+        else:
+            positions = self.position_book.values()
+        metrics.open_positions.set(len(positions))
+        for stat, value in self.transport_stats.stats().items():
+            metrics.http_transport.set(value, stat=stat)
+        if not positions:
+            metrics.distinct_tokens.set(0)
+            logger.debug("No open positions to evaluate.")
+            return
+
+        token_addresses = {pos.token_address for pos in positions if pos.token_address}
+        metrics.distinct_tokens.set(len(token_addresses))
+        await self.update_stream_subscriptions(token_addresses | {SOL_TOKEN_ADDRESS})
+
+        # SOL rides along in the same batch instead of costing its own round trip.
+        with metrics.phase_seconds.time(phase="fetch_prices"):
+            price_map = await self.resolve_prices(
+                session,
+                token_addresses | {SOL_TOKEN_ADDRESS},
+            )
+        for stat, value in self.price_cache.stats().items():
+            metrics.price_cache.set(value, stat=stat)
+        if self.scheduler is not None:
+            for stat, value in self.scheduler.stats().items():
+                metrics.poll_scheduler.set(value, stat=stat)
+        sol_price = price_map.get(SOL_TOKEN_ADDRESS)
+        if sol_price is None:
+            logger.warning("Skipping tick: unable to fetch SOL price.")
+            return
+
+        if not token_addresses.intersection(price_map):
+            logger.warning("Skipping tick: no token prices resolved.")
+            return
+
+        if self.recorder is not None:
+            self.recorder.record(
+                time.time(),
+                (position.as_row() for position in positions),
+                price_map,
+                sol_price,
+                self.position_book.version,
+            )
+
+        detected_at = time.monotonic()
+        with metrics.phase_seconds.time(phase="evaluate"):
+            if THRESHOLD_INDEX:
+                breaches = self.find_breaches_indexed(positions, price_map, sol_price)
+            else:
+                breaches = self.find_breaches(
+                    positions,
+                    price_map,
+                    sol_price,
+                    version=self.position_book.version,
+                )
+        with metrics.phase_seconds.time(phase="write"):
+            liquidations = await self.liquidate_and_evict(session, breaches, detected_at)
+
+        if liquidations:
+            logger.info("Liquidated %s position(s) this tick.", liquidations)
+        else:
+            logger.debug("All %s open positions are healthy.", len(positions))
+        logger.debug("Price cache: %s", self.price_cache.stats())
+
+    async def liquidate_and_evict(
+        self,
+        session: ClientSession,
+        breaches: list[Tuple[PositionRecord, float, float, float]],
+        detected_at: Optional[float] = None,
+    ) -> int:
+        """Write breaches and drop settled positions from the book. Returns the count liquidated."""
+        outcomes = await self.liquidate_positions(session, breaches, detected_at)
+        liquidations = 0
+        for position_id, outcome in outcomes.items():
+            if outcome == WRITE_FAILED:
+                continue  # stays in the book and is retried next tick
+            self.position_book.discard(position_id)
+            self.threshold_index.remove(position_id)
+            if outcome == WRITE_LIQUIDATED:
+                liquidations += 1
+        return liquidations
+
+    async def update_stream_subscriptions(self, addresses: set[str]) -> None:
+        if self.price_stream is None:
+            return
+        added = addresses - self.stream_subscriptions
+        removed = self.stream_subscriptions - addresses
+        self.stream_subscriptions = set(addresses)
+        try:
+            if removed:
+                await self.price_stream.unsubscribe(removed)
+            if added:
+                await self.price_stream.subscribe(added)
+        except Exception as exc:
+            logger.warning("Price stream subscription update failed: %s", exc)
+
+    async def stream_prices(self, session: ClientSession) -> None:
+        """Consume the push feed until shutdown, reconnecting with backoff."""
+        backoff = 1.0
+        while not self.stop_event.is_set():
+            try:
+                await self.price_stream.connect(session)
+                await self.price_stream.subscribe(self.stream_subscriptions)
+                logger.info(
+                    "Price stream connected (%s subscription(s)).",
+                    len(self.stream_subscriptions),
+                )
+                backoff = 1.0
+                async for address, price in self.price_stream.updates():
+                    self.on_price_update(session, address, price)
+                logger.warning("Price stream closed; reconnecting...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Price stream failed: %s", exc)
+
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, STREAM_RECONNECT_MAX_SECONDS)
+
+    def on_price_update(self, session: ClientSession, address: str, price: float) -> None:
+        """Re-evaluate only the positions affected by one pushed price."""
+        detected_at = time.monotonic()
+        self.price_cache.update({address: price}, now=detected_at)
+        if self.scheduler is not None:
+            self.scheduler.observe({address: price}, now=detected_at)
+
+        if address == SOL_TOKEN_ADDRESS:
+            # A SOL move shifts every margin trigger; check all priced tokens.
+            price_map = self.price_cache.peek(self.stream_subscriptions, now=detected_at)
+        else:
+            price_map = self.price_cache.peek((address, SOL_TOKEN_ADDRESS), now=detected_at)
+        sol_price = price_map.get(SOL_TOKEN_ADDRESS)
+        if sol_price is None:
+            return
+        if address != SOL_TOKEN_ADDRESS:
+            price_map = {address: price}
+
+        book = self.position_book
+        if THRESHOLD_INDEX:
+            # The index only walks the book when SOL leaves its band.
+            breaches = self.find_breaches_indexed(book.positions.values(), price_map, sol_price)
+        else:
+            breaches = self.find_breaches_scalar(book.for_tokens(price_map), price_map, sol_price)
+
+        if breaches:
+            self.track_background(
+                self.liquidate_and_evict(session, breaches, detected_at)
+            )
+
+    async def stream_positions(self, session: ClientSession) -> None:
+        """Apply pushed position changes until shutdown, reconnecting with backoff."""
+        backoff = 1.0
+        while not self.stop_event.is_set():
+            try:
+                await self.position_feed.connect(session)
+                logger.info("Position feed connected.")
+                backoff = 1.0
+                async for change_type, row, committed_at in self.position_feed.changes():
+                    self.on_position_change(session, change_type, row, committed_at)
+                logger.warning("Position feed closed; reconnecting...")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Position feed failed: %s", exc)
+
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, STREAM_RECONNECT_MAX_SECONDS)
+
+    def on_position_change(
+        self,
+        session: ClientSession,
+        change_type: str,
+        row: dict,
+        committed_at: Optional[datetime] = None,
+    ) -> None:
+        """Apply one pushed row and check it at once if its prices are cached."""
+        row = dict(row)
+        owned = self.shard.owns(row) if self.shard is not None else True
+        row.pop("token_shard", None)
+        position_id = row.get("id")
+        if owned is False or (owned is None and position_id not in self.position_book.positions):
+            # Not ours, or unknown ownership for a row we never held; REST decides.
+            self.metrics.position_feed_changes.inc(type="ignored")
+            return
+
+        self.metrics.position_feed_changes.inc(type=change_type or "unknown")
+        if committed_at is not None:
+            lag = (datetime.now(timezone.utc) - committed_at).total_seconds()
+            self.metrics.position_feed_lag_seconds.observe(max(0.0, lag))
+
+        if position_id in self.inflight_liquidations:
+            return
+        held = self.position_book.positions.get(position_id)
+        if held is not None:
+            held_at = parse_timestamp(held.updated_at)
+            pushed_at = parse_timestamp(row.get("updated_at"))
+            if held_at and pushed_at and pushed_at < held_at:
+                return  # REST already delivered a newer version
+        self.threshold_index.apply(*self.position_book.apply([row], advance_cursor=False))
+        position = self.position_book.positions.get(position_id)
+        if position is None:
+            return
+
+        detected_at = time.monotonic()
+        token_address = position.token_address
+        price_map = self.price_cache.peek((token_address, SOL_TOKEN_ADDRESS), now=detected_at)
+        sol_price = price_map.get(SOL_TOKEN_ADDRESS)
+        if sol_price is None or token_address not in price_map:
+            return  # priced on the next tick
+        breaches = self.find_breaches_scalar(
+            [position],
+            {token_address: price_map[token_address]},
+            sol_price,
+        )
+        if breaches:
+            self.track_background(
+                self.liquidate_and_evict(session, breaches, detected_at)
+            )
+
+    def find_breaches(
+        self,
+        positions: list[PositionRecord],
+        price_map: Dict[str, float],
+        sol_price: float,
+        version: Optional[int] = None,
+    ) -> list[Tuple[PositionRecord, float, float, float]]:
+        """Return (position, current_price, pnl_usd, margin_ratio) for every breach.
+
+        `version` identifies the position set; when given, the columnar layout is
+        reused until it changes.
+        """
+        if VECTORIZED_EVALUATION and np is not None:
+            return self.find_breaches_vectorized(
+                positions,
+                price_map,
+                sol_price,
+                version,
+            )
+        return self.find_breaches_scalar(positions, price_map, sol_price)
+
+    def find_breaches_indexed(
+        self,
+        positions: Iterable[PositionRecord],
+        price_map: Dict[str, float],
+        sol_price: float,
+    ) -> list[Tuple[PositionRecord, float, float, float]]:
+        """Evaluate only the positions whose indexed trigger has been crossed."""
+        index = self.threshold_index
+        if index.needs_rebuild(sol_price):
+            index.rebuild(positions, sol_price)
+            logger.debug(
+                "Threshold index rebuilt for %s position(s) at SOL $%.4f.",
+                len(index),
+                sol_price,
+            )
+        candidates = index.candidates(price_map)
+        return self.find_breaches_scalar(candidates, price_map, sol_price)
+
+    def find_breaches_scalar(
+        self,
+        positions: list[PositionRecord],
+        price_map: Dict[str, float],
+        sol_price: float,
+    ) -> list[Tuple[PositionRecord, float, float, float]]:
+        breaches = []
+        for position in positions:
+            token_address = position.token_address
+            if not token_address:
+                continue
+
+            current_price = price_map.get(token_address)
+            if current_price is None:
+                continue
+
+            should_liquidate, pnl_usd, margin_ratio = self.evaluate_position(
+                position,
+                current_price,
+                sol_price,
+            )
+            if should_liquidate:
+                breaches.append((position, current_price, pnl_usd, margin_ratio))
+        return breaches
+
+    def find_breaches_vectorized(
+        self,
+        positions: list[PositionRecord],
+        price_map: Dict[str, float],
+        sol_price: float,
+        version: Optional[int] = None,
+    ) -> list[Tuple[PositionRecord, float, float, float]]:
+        if version is None or self.columns is None or self.columns_version != version:
+            self.columns = PositionColumns(positions)
+            self.columns_version = version
+        columns = self.columns
+
+        current, should_liquidate, pnl_usd, margin_ratio = columns.evaluate(
+            price_map,
+            sol_price,
+        )
+        breaches = []
+        for idx in np.flatnonzero(should_liquidate):
+            position = columns.positions[idx]
+            breach = (
+                position,
+                float(current[idx]),
+                float(pnl_usd[idx]),
+                float(margin_ratio[idx]),
+            )
+            self.log_breach(
+                position,
+                "Long" if columns.is_long[idx] else "Short",
+                breach[1],
+                float(columns.liquidation_price[idx]),
+                breach[3],
+            )
+            breaches.append(breach)
+        return breaches
+
+    async def resolve_prices(
+        self,
+        session: ClientSession,
+        addresses: Iterable[str],
+    ) -> Dict[str, float]:
+        """Serve prices from the cache, fetching only what is missing or too old.
+
+        Stale-but-usable entries are returned immediately and refreshed in the
+        background so a slow Birdeye call never holds up the tick.
+        """
+        if self.scheduler is not None:
+            return await self.resolve_prices_adaptive(session, addresses)
+
+        prices, stale, missing = self.price_cache.lookup(addresses)
+        self.update_hedged_tokens(addresses)
+
+        # Start the refresh before awaiting misses so it never waits on them.
+        to_refresh = [addr for addr in stale if addr not in self.refreshing]
+        if to_refresh:
+            self.refreshing.update(to_refresh)
+            self.track_background(self.refresh_prices(session, to_refresh))
+
+        if missing:
+            prices.update(await self.fetch_prices_within_deadline(session, missing))
+
+        return prices
+
+    async def resolve_prices_adaptive(
+        self,
+        session: ClientSession,
+        addresses: Iterable[str],
+    ) -> Dict[str, float]:
+        """Fetch only the tokens the scheduler says are due; serve the rest from cache."""
+        addresses = set(addresses)
+        distances = self.trigger_distances(self.price_cache.last_known(addresses))
+        self.update_hedged_tokens(addresses, distances)
+        batch_size = max(1, BIRDEYE_BATCH_SIZE) if BIRDEYE_BATCH_MODE else 1
+        due = self.scheduler.plan(addresses, distances, batch_size)
+        if due:
+            await self.fetch_prices_within_deadline(session, due)
+            if self.scheduler.deferred:
+                logger.debug(
+                    "Request budget deferred %s due token(s).",
+                    self.scheduler.deferred,
+                )
+
+        prices, _, _ = self.price_cache.lookup(addresses)
+        return prices
+
+    def trigger_distances(self, last_prices: Dict[str, float]) -> Dict[str, float]:
+        sol_price = last_prices.get(SOL_TOKEN_ADDRESS)
+        if sol_price is None:
+            return {}
+        index = self.threshold_index
+        if index.needs_rebuild(sol_price):
+            index.rebuild(self.position_book.values(), sol_price)
+        return index.trigger_distances(last_prices)
+
+    def update_hedged_tokens(
+        self,
+        addresses: Iterable[str],
+        distances: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """Hedge requests for tokens within HEDGE_DISTANCE of a trigger."""
+        if HEDGE_DELAY_SECONDS <= 0:
+            self.hedged_tokens = set()
+            return
+        if distances is None:
+            distances = self.trigger_distances(self.price_cache.last_known(addresses))
+        self.hedged_tokens = {
+            address for address, distance in distances.items() if distance < HEDGE_DISTANCE
+        }
 
-POLL_SECONDS = 3.0
-BIRDEYE_TIMEOUT_SECONDS = 8.0
-BIRDEYE_CONCURRENCY = 6
-LOG_LEVEL = "INFO"
+    async def fetch_prices_within_deadline(
+        self,
+        session: ClientSession,
+        addresses: Iterable[str],
+    ) -> Dict[str, float]:
+        """Fetch into the cache, waiting at most TICK_PRICE_DEADLINE_SECONDS.
 
-SUPABASE_REST_URL = f"{SUPABASE_URL}/rest/v1"
-SUPABASE_HEADERS = {
-    "apikey": SUPABASE_SERVICE_ROLE_KEY,
-    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
-    "Content-Type": "application/json",
-}
+        Returns what resolved in time. Fetches still running at the deadline are
+        left in the background; their prices land in the cache for a later tick.
+        Addresses already being fetched by an earlier tick are not requested again.
+        """
+        addresses = [addr for addr in dict.fromkeys(addresses) if addr not in self.refreshing]
+        resolved: Dict[str, float] = {}
+        if not addresses:
+            return resolved
 
-BIRDEYE_PRICE_ENDPOINT = "https://public-api.birdeye.so/public/price"
-BIRDEYE_HEADERS = {
-    "X-API-KEY": BIRDEYE_API_KEY,
-    "accept": "application/json",
-}
-SOL_TOKEN_ADDRESS = "So11111111111111111111111111111111111111112"
+        self.refreshing.update(addresses)
+        task = self.track_background(
+            self.refresh_prices(session, addresses, on_prices=resolved.update)
+        )
+        timeout = TICK_PRICE_DEADLINE_SECONDS if TICK_PRICE_DEADLINE_SECONDS > 0 else None
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+        if not done:
+            late = [addr for addr in addresses if addr not in resolved]
+            self.metrics.price_deadline_hits.inc()
+            for address in late:
+                self.metrics.price_deadline_late.inc(token=address)
+            logger.warning(
+                "Price deadline of %.1fs hit; %s token(s) carried over to the next tick: %s",
+                TICK_PRICE_DEADLINE_SECONDS,
+                len(late),
+                ", ".join(late[:5]) + (" ..." if len(late) > 5 else ""),
+            )
+        return dict(resolved)
 
+    async def refresh_prices(
+        self,
+        session: ClientSession,
+        addresses: list[str],
+        on_prices: Optional[Callable[[Dict[str, float]], None]] = None,
+    ) -> None:
+        """Fetch into the cache as results arrive. Caller marks `addresses` in `refreshing`."""
 
-logging.basicConfig(
-    level=LOG_LEVEL,
-    stream=sys.stdout,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-)
-logger = logging.getLogger("liquidation-watcher")
+        def store(prices: Dict[str, float]) -> None:
+            self.store_prices(prices)
+            self.refreshing.difference_update(prices)
+            if on_prices is not None:
+                on_prices(prices)
 
+        try:
+            await self.fetch_token_prices(session, addresses, on_prices=store)
+        except Exception as exc:  # pragma: no cover - best-effort logging
+            logger.warning("Background price refresh failed: %s", exc)
+        finally:
+            self.refreshing.difference_update(addresses)
 
-def chunked(iterable: Iterable[str], size: int) -> Iterable[Tuple[str, ...]]:
-    """Yield successive n-sized chunks from iterable."""
-    chunk: list[str] = []
-    for item in iterable:
-        chunk.append(item)
-        if len(chunk) == size:
-            yield tuple(chunk)
-            chunk = []
-    if chunk:
-        yield tuple(chunk)
+    def store_prices(self, prices: Dict[str, float]) -> None:
+        now = time.monotonic()
+        self.price_cache.update(prices, now=now)
+        if self.scheduler is not None:
+            self.scheduler.observe(prices, now=now)
 
+    async def sync_positions(self, session: ClientSession) -> list[PositionRecord]:
+        book = self.position_book
+        if self.shard is not None:
+            if await self.shard.maybe_heartbeat(session):
+                book.invalidate()
+            if not self.shard.owned:
+                book.replace([])
+                self.threshold_index.invalidate()
+                return []
 
-def iso_utc_now() -> str:
-    return datetime.now(timezone.utc).isoformat()
+        if book.needs_full_sync() or book.cursor is None:
+            book.replace(await self.fetch_open_positions(session))
+            self.threshold_index.invalidate()
+            logger.debug("Position book resynced: %s open position(s).", len(book))
+            return book.values()
 
+        since = book.cursor - timedelta(seconds=POSITION_CURSOR_LOOKBACK_SECONDS)
+        rows = await self.fetch_changed_positions(session, since)
+        upserted, evicted = book.apply(rows)
+        self.threshold_index.apply(upserted, evicted)
+        logger.debug(
+            "Position book: %s changed row(s), %s upserted, %s evicted, %s open.",
+            len(rows),
+            len(upserted),
+            len(evicted),
+            len(book),
+        )
+        return book.values()
 
-def to_float(value: Optional[object], default: float = 0.0) -> float:
-    if value is None:
-        return default
-    if isinstance(value, (int, float)):
-        return float(value)
-    try:
-        return float(str(value))
-    except (TypeError, ValueError):
-        return default
+    async def fetch_open_positions(self, session: ClientSession) -> list[dict]:
+        statuses = ",".join(OPEN_POSITION_STATUSES)
+        return await self.fetch_position_rows(session, {"status": f"in.({statuses})"})
+
+    async def fetch_changed_positions(
+        self,
+        session: ClientSession,
+        since: datetime,
+    ) -> list[dict]:
+        # No status filter: closed and liquidated rows are needed for eviction.
+        return await self.fetch_position_rows(
+            session,
+            {"updated_at": f"gte.{format_timestamp(since)}"},
+        )
 
+    async def fetch_position_rows(
+        self,
+        session: ClientSession,
+        filters: Dict[str, str],
+    ) -> list[dict]:
+        """Page through trading_positions in (updated_at, id) order."""
+        url = f"{SUPABASE_REST_URL}/trading_positions"
+        rows: list[dict] = []
+        last: Optional[dict] = None
+        if self.shard is not None:
+            filters = {**filters, **self.shard.position_filter()}
 
-class LiquidationWatcher:
-    def __init__(self) -> None:
-        self.stop_event = asyncio.Event()
+        while True:
+            params = {
+                "select": ",".join(POSITION_COLUMNS),
+                "order": "updated_at.asc,id.asc",
+                "limit": str(POSITION_PAGE_SIZE),
+                **filters,
+            }
+            if last is not None:
+                last_ts = parse_timestamp(last.get("updated_at"))
+                if last_ts is None:
+                    break
+                ts = format_timestamp(last_ts)
+                params["or"] = (
+                    f"(updated_at.gt.{ts},"
+                    f"and(updated_at.eq.{ts},id.gt.{last.get('id')}))"
+                )
 
-    def request_shutdown(self) -> None:
-        logger.warning("Shutdown signal received; draining in-flight tasks...")
-        self.stop_event.set()
+            async with session.get(url, headers=SUPABASE_HEADERS, params=params) as resp:
+                if resp.status != 200:
+                    text = await resp.text()
+                    raise RuntimeError(
+                        f"Failed to fetch positions ({resp.status}): {text}"
+                    )
+                # Pages are capped at POSITION_PAGE_SIZE, so each is decoded in one pass.
+                page = await read_json(resp) or []
 
-    async def run(self) -> None:
-        timeout = ClientTimeout(total=BIRDEYE_TIMEOUT_SECONDS + 2)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            while not self.stop_event.is_set():
-                started_at = time.monotonic()
-                try:
-                    await self.tick(session)
-                except Exception as exc:  # pragma: no cover - best-effort logging
-                    logger.exception("Tick failed: %s", exc)
+            rows.extend(page)
+            if len(page) < POSITION_PAGE_SIZE:
+                return rows
+            last = page[-1]
 
-                elapsed = time.monotonic() - started_at
-                sleep_for = max(0.0, POLL_SECONDS - elapsed)
-                try:
-                    await asyncio.wait_for(self.stop_event.wait(), timeout=sleep_for)
-                except asyncio.TimeoutError:
+        return rows
+
+    async def fetch_token_prices(
+        self,
+        session: ClientSession,
+        addresses: Iterable[str],
+        on_prices: Optional[Callable[[Dict[str, float]], None]] = None,
+    ) -> Dict[str, float]:
+        """Resolve addresses across the price sources; `on_prices` sees each
+        token's price as soon as it is settled.
+
+        Every source whose breaker allows it is queried concurrently. In "first"
+        mode a token settles on its first valid quote; in "median" mode once all
+        sources quoted it, or PRICE_MEDIAN_WAIT_SECONDS after its first quote.
+        Sources still running once every token has settled finish in the
+        background so their latency and errors are still recorded.
+        """
+        addresses = list(dict.fromkeys(addresses))
+        if not addresses or not self.price_sources:
+            return {}
+
+        now = time.monotonic()
+        sources = [
+            source for source in self.price_sources
+            if self.source_breakers[source.name].allow(now)
+        ]
+        for source in self.price_sources:
+            if source not in sources:
+                self.metrics.price_source_calls.inc(source=source.name, outcome="skipped")
+        if not sources:
+            # Every breaker is open; probing beats going blind.
+            sources = list(self.price_sources)
+
+        median = PRICE_AGGREGATION == "median"
+        quotes: Dict[str, Dict[str, float]] = {}
+        first_quoted: Dict[str, float] = {}
+        touched: set[str] = set()
+        pending = set(addresses)
+        resolved: Dict[str, float] = {}
+        progress = asyncio.Event()
+
+        def collect(source_name: str) -> Callable[[Dict[str, float]], None]:
+            def on_source_prices(prices: Dict[str, float]) -> None:
+                at = time.monotonic()
+                for address, price in prices.items():
+                    if address in pending and math.isfinite(price) and price > 0:
+                        quotes.setdefault(address, {})[source_name] = price
+                        first_quoted.setdefault(address, at)
+                        touched.add(address)
+                progress.set()
+
+            return on_source_prices
+
+        tasks = [
+            self.track_background(
+                self.query_price_source(session, source, addresses, collect(source.name))
+            )
+            for source in sources
+        ]
+
+        def settle(candidates: Iterable[str], final: bool) -> None:
+            at = time.monotonic()
+            settled: Dict[str, float] = {}
+            for address in list(candidates):
+                source_quotes = quotes.get(address)
+                if address not in pending or not source_quotes:
                     continue
+                if not median:
+                    source_name, price = next(iter(source_quotes.items()))
+                    self.metrics.price_source_wins.inc(source=source_name)
+                else:
+                    complete = final or len(source_quotes) == len(sources)
+                    waited = at - first_quoted[address] >= PRICE_MEDIAN_WAIT_SECONDS
+                    price = None
+                    if complete or waited:
+                        price = self.agreed_price(address, source_quotes, report=complete)
+                    if price is None and not complete:
+                        # Too early, or a tie another source may still break.
+                        touched.add(address)
+                        continue
+                pending.discard(address)
+                if price is not None:
+                    settled[address] = price
+            if settled:
+                resolved.update(settled)
+                if on_prices is not None:
+                    on_prices(settled)
 
-    async def tick(self, session: ClientSession) -> None:
-        positions = await self.fetch_open_positions(session)
-        if not positions:
-            logger.debug("No open positions to evaluate.")
-            return
+        running = set(tasks)
+        while pending and running:
+            progress.clear()
+            candidates = list(touched)
+            touched.clear()
+            settle(candidates, final=False)
+            if not pending:
+                break
+            waiter = asyncio.create_task(progress.wait())
+            try:
+                done, _ = await asyncio.wait(
+                    running | {waiter},
+                    timeout=PRICE_MEDIAN_WAIT_SECONDS if median and quotes else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                waiter.cancel()
+            running -= done
+        settle(list(quotes), final=True)
+        return resolved
 
-        sol_price = await self.fetch_price(session, SOL_TOKEN_ADDRESS)
-        if sol_price is None:
-            logger.warning("Skipping tick: unable to fetch SOL price.")
-            return
+    def agreed_price(
+        self,
+        address: str,
+        source_quotes: Dict[str, float],
+        report: bool = True,
+    ) -> Optional[float]:
+        """Median of the quotes within PRICE_SOURCE_TOLERANCE of the overall median.
 
-        token_addresses = {
-            pos["token_address"]
-            for pos in positions
-            if pos.get("token_address")
+        Returns None when quotes from several sources do not agree; `report`
+        counts and logs that as a disagreement.
+        """
+        values = sorted(source_quotes.values())
+        middle = statistics.median(values)
+        agreeing = {
+            source_name: price
+            for source_name, price in source_quotes.items()
+            if abs(price - middle) <= PRICE_SOURCE_TOLERANCE * middle
         }
+        if len(values) > 1 and len(agreeing) < 2:
+            if not report:
+                return None
+            self.metrics.price_source_disagreements.inc()
+            logger.warning(
+                "Price sources disagree on %s beyond %.1f%%: %s",
+                address,
+                PRICE_SOURCE_TOLERANCE * 100,
+                source_quotes,
+            )
+            return None
+        for source_name in agreeing:
+            self.metrics.price_source_wins.inc(source=source_name)
+        return statistics.median(agreeing.values())
 
-        price_map = await self.fetch_token_prices(session, token_addresses)
-        if not price_map:
-            logger.warning("Skipping tick: no token prices resolved.")
-            return
+    async def query_price_source(
+        self,
+        session: ClientSession,
+        source: PriceSource,
+        addresses: list[str],
+        on_prices: Callable[[Dict[str, float]], None],
+    ) -> Dict[str, float]:
+        """Call one source, feeding its breaker and per-source metrics."""
+        breaker = self.source_breakers[source.name]
+        metrics = self.metrics
+        try:
+            with metrics.price_source_seconds.time(source=source.name):
+                prices = await source.fetch(session, addresses, on_prices)
+        except asyncio.CancelledError:
+            breaker.trial_inflight = False
+            raise
+        except Exception as exc:
+            prices = {}
+            outcome = "error"
+            logger.warning("Price source %s failed: %s", source.name, exc)
+        else:
+            outcome = "ok" if prices else "empty"
 
-        liquidations = 0
-        for position in positions:
-            token_address = position.get("token_address")
-            if not token_address:
-                continue
+        metrics.price_source_calls.inc(source=source.name, outcome=outcome)
+        if outcome == "ok":
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        metrics.price_source_state.set(
+            0 if breaker.state() == CircuitBreaker.CLOSED else 1,
+            source=source.name,
+        )
+        return prices
 
-            current_price = price_map.get(token_address)
-            if current_price is None:
-                continue
+    async def fetch_birdeye_prices(
+        self,
+        session: ClientSession,
+        addresses: Iterable[str],
+        on_prices: Optional[Callable[[Dict[str, float]], None]] = None,
+    ) -> Dict[str, float]:
+        """Birdeye: multi_price batches, then single fetches for what they missed.
 
-            should_liquidate, pnl_usd, margin_ratio = self.evaluate_position(
-                position,
-                current_price,
-                sol_price,
+        Only tokens a successful batch response left out are fetched one by one;
+        a batch that failed outright (rate limited, timed out) was already
+        retried as a batch, and fanning it out into single requests would only
+        multiply the load on a struggling API.
+        """
+        addresses = list(dict.fromkeys(addresses))
+        if not BIRDEYE_BATCH_MODE:
+            return await self.fetch_token_prices_individually(session, addresses, on_prices)
+
+        prices, failed = await self.fetch_token_prices_batched(session, addresses, on_prices)
+        missing = [addr for addr in addresses if addr not in prices and addr not in failed]
+        if missing:
+            logger.debug(
+                "Batch price lookup missed %s token(s); falling back to single fetches.",
+                len(missing),
+            )
+            prices.update(
+                await self.fetch_token_prices_individually(session, missing, on_prices)
             )
+        return prices
+
+    async def fetch_token_prices_batched(
+        self,
+        session: ClientSession,
+        addresses: Iterable[str],
+        on_prices: Optional[Callable[[Dict[str, float]], None]] = None,
+    ) -> Tuple[Dict[str, float], set[str]]:
+        """Returns (prices, addresses whose batch call failed on every attempt)."""
+        sem = asyncio.Semaphore(max(1, BIRDEYE_CONCURRENCY))
+
+        async def fetch(
+            batch: Tuple[str, ...],
+        ) -> Tuple[Tuple[str, ...], Optional[Dict[str, float]]]:
+            async with sem:
+                return batch, await self.fetch_price_batch(session, batch)
+
+        tasks = [
+            asyncio.create_task(fetch(batch))
+            for batch in chunked(addresses, max(1, BIRDEYE_BATCH_SIZE))
+        ]
+        prices: Dict[str, float] = {}
+        failed: set[str] = set()
 
-            if not should_liquidate:
+        for task in asyncio.as_completed(tasks):
+            batch, batch_prices = await task
+            if batch_prices is None:
+                failed.update(batch)
                 continue
+            prices.update(batch_prices)
+            if on_prices is not None and batch_prices:
+                on_prices(batch_prices)
 
-            await self.mark_liquidated(
-                session,
-                position,
-                current_price,
-                pnl_usd,
-                margin_ratio,
-            )
-            liquidations += 1
+        return prices, failed
 
-        if liquidations:
-            logger.info("Liquidated %s position(s) this tick.", liquidations)
-        else:
-            logger.debug("All %s open positions are healthy.", len(positions))
+    async def fetch_price_batch(
+        self,
+        session: ClientSession,
+        token_addresses: Tuple[str, ...],
+        retries: int = 3,
+    ) -> Optional[Dict[str, float]]:
+        """Resolve a chunk of addresses with one multi_price call.
 
-    async def fetch_open_positions(self, session: ClientSession) -> list[dict]:
-        params = {
-            "select": ",".join(
-                [
-                    "id",
-                    "wallet_address",
-                    "token_address",
-                    "token_symbol",
-                    "direction",
-                    "entry_price",
-                    "liquidation_price",
-                    "amount",
-                    "leverage",
-                    "collateral_sol",
-                    "status",
-                ]
-            ),
-            "status": "in.(open,opening)",
-        }
-        url = f"{SUPABASE_REST_URL}/trading_positions"
-        async with session.get(url, headers=SUPABASE_HEADERS, params=params) as resp:
-            if resp.status != 200:
-                text = await resp.text()
-                raise RuntimeError(
-                    f"Failed to fetch positions ({resp.status}): {text}"
+        A failed call is retried as a whole with backoff. Never raises: returns
+        None when every attempt failed, otherwise the prices found, leaving out
+        tokens the response had no value for so the caller can retry them one
+        by one.
+        """
+        params = {"list_address": ",".join(token_addresses), "chain": "solana"}
+        backoff = 1.0
+
+        async def request() -> dict:
+            with self.metrics.birdeye_seconds.time(endpoint="multi_price"):
+                async with session.get(
+                    BIRDEYE_MULTI_PRICE_ENDPOINT,
+                    headers=BIRDEYE_HEADERS,
+                    params=params,
+                ) as resp:
+                    if resp.status != 200:
+                        text = await resp.text()
+                        raise RuntimeError(f"Birdeye {resp.status}: {text}")
+                    payload = await read_json(resp)
+                    if not isinstance(payload, dict) or not payload.get("success"):
+                        raise RuntimeError(f"Birdeye multi_price failed: {payload}")
+                    return payload
+
+        hedge = not self.hedged_tokens.isdisjoint(token_addresses)
+        for attempt in range(1, retries + 1):
+            if attempt > 1:
+                self.metrics.birdeye_retries.inc(token="batch")
+            try:
+                payload = await self.hedged(request, hedge)
+            except Exception as exc:
+                self.metrics.birdeye_errors.inc(token="batch")
+                logger.warning(
+                    "Batch price fetch failed for %s token(s) (%s/%s): %s",
+                    len(token_addresses),
+                    attempt,
+                    retries,
+                    exc,
                 )
-            data = await resp.json()
-            return data or []
+            else:
+                break
+            if attempt < retries:
+                await asyncio.sleep(backoff)
+                backoff *= 2
+        else:
+            return None
 
-    async def fetch_token_prices(
+        data = payload.get("data") or {}
+        prices: Dict[str, float] = {}
+        for address in token_addresses:
+            entry = data.get(address)
+            value = entry.get("value") if isinstance(entry, dict) else None
+            if value is not None:
+                prices[address] = float(value)
+        return prices
+
+    async def fetch_token_prices_individually(
         self,
         session: ClientSession,
         addresses: Iterable[str],
+        on_prices: Optional[Callable[[Dict[str, float]], None]] = None,
     ) -> Dict[str, float]:
         sem = asyncio.Semaphore(max(1, BIRDEYE_CONCURRENCY))
 
@@ -238,6 +2698,8 @@ class LiquidationWatcher:
             address, price = await task
             if price is not None:
                 prices[address] = price
+                if on_prices is not None:
+                    on_prices({address: price})
 
         return prices
 
@@ -250,8 +2712,8 @@ class LiquidationWatcher:
         params = {"address": token_address, "chain": "solana"}
         backoff = 1.0
 
-        for attempt in range(1, retries + 1):
-            try:
+        async def request() -> dict:
+            with self.metrics.birdeye_seconds.time(endpoint="price"):
                 async with session.get(
                     BIRDEYE_PRICE_ENDPOINT,
                     headers=BIRDEYE_HEADERS,
@@ -262,8 +2724,15 @@ class LiquidationWatcher:
                         raise RuntimeError(
                             f"Birdeye {resp.status} for {token_address}: {text}"
                         )
-                    payload = await resp.json()
+                    return await read_json(resp)
+
+        for attempt in range(1, retries + 1):
+            if attempt > 1:
+                self.metrics.birdeye_retries.inc(token=token_address)
+            try:
+                payload = await self.hedged(request, token_address in self.hedged_tokens)
             except Exception as exc:
+                self.metrics.birdeye_errors.inc(token=token_address)
                 logger.warning(
                     "Price fetch failed for %s (%s/%s): %s",
                     token_address,
@@ -278,6 +2747,7 @@ class LiquidationWatcher:
                     else None
                 )
                 if value is None:
+                    self.metrics.birdeye_errors.inc(token=token_address)
                     logger.warning(
                         "Birdeye returned no price for %s: %s",
                         token_address,
@@ -286,25 +2756,60 @@ class LiquidationWatcher:
                 else:
                     return float(value)
 
-            await asyncio.sleep(backoff)
-            backoff *= 2
+            if attempt < retries:
+                await asyncio.sleep(backoff)
+                backoff *= 2
 
         return None
 
+    async def hedged(self, request: Callable[[], Awaitable[T]], hedge: bool) -> T:
+        """Await request(); when hedging, race a duplicate once the first is slow.
+
+        The duplicate starts after HEDGE_DELAY_SECONDS. The first successful
+        response wins and the other request is cancelled; if both fail the last
+        error is raised.
+        """
+        if not hedge or HEDGE_DELAY_SECONDS <= 0:
+            return await request()
+
+        tasks = {asyncio.create_task(request())}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=HEDGE_DELAY_SECONDS)
+            if not done:
+                duplicate = asyncio.create_task(request())
+                tasks.add(duplicate)
+                self.metrics.birdeye_hedges.inc(outcome="sent")
+            else:
+                duplicate = None
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is duplicate:
+                            self.metrics.birdeye_hedges.inc(outcome="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
     def evaluate_position(
         self,
-        position: dict,
+        position: PositionRecord,
         current_price: float,
         sol_price: float,
     ) -> Tuple[bool, float, float]:
-        direction = (position.get("direction") or "Long").capitalize()
-        entry_price = to_float(position.get("entry_price"))
-        liquidation_price = to_float(position.get("liquidation_price"))
-        amount = to_float(position.get("amount"))
-        leverage = max(1.0, to_float(position.get("leverage"), 1.0))
-        collateral_sol = max(0.0, to_float(position.get("collateral_sol")))
-
-        if direction == "Long":
+        entry_price = position.entry_price
+        liquidation_price = position.liquidation_price
+        amount = position.amount
+        leverage = position.leverage
+        collateral_sol = position.collateral_sol
+
+        if position.is_long:
             pnl_usd = (current_price - entry_price) * amount * leverage
             price_triggered = current_price <= liquidation_price
         else:
@@ -316,16 +2821,13 @@ class LiquidationWatcher:
         if pnl_sol < 0 and collateral_sol > 0:
             margin_ratio = min(abs(pnl_sol) / collateral_sol, 1.0)
 
-        margin_triggered = margin_ratio >= 0.999
+        margin_triggered = margin_ratio >= MARGIN_LIQUIDATION_RATIO
         should_liquidate = price_triggered or margin_triggered
 
         if should_liquidate:
-            logger.info(
-                "Position %s (%s %s) breached liquidation threshold: "
-                "price %.8f vs threshold %.8f | margin_ratio=%.3f",
-                position.get("id"),
-                direction,
-                position.get("token_symbol"),
+            self.log_breach(
+                position,
+                position.direction,
                 current_price,
                 liquidation_price,
                 margin_ratio,
@@ -333,14 +2835,170 @@ class LiquidationWatcher:
 
         return should_liquidate, pnl_usd, margin_ratio
 
+    def log_breach(
+        self,
+        position: PositionRecord,
+        direction: str,
+        current_price: float,
+        liquidation_price: float,
+        margin_ratio: float,
+    ) -> None:
+        logger.info(
+            "Position %s (%s %s) breached liquidation threshold: "
+            "price %.8f vs threshold %.8f | margin_ratio=%.3f",
+            position.id,
+            direction,
+            position.token_symbol,
+            current_price,
+            liquidation_price,
+            margin_ratio,
+        )
+
+    async def liquidate_positions(
+        self,
+        session: ClientSession,
+        breaches: list[Tuple[PositionRecord, float, float, float]],
+        detected_at: Optional[float] = None,
+    ) -> Dict[object, str]:
+        """Write all breaches concurrently and report an outcome per position id.
+
+        Bulk RPC chunks run LIQUIDATION_WRITE_CONCURRENCY at a time; a chunk whose
+        RPC call fails is retried as individual guarded PATCHes. A failing write
+        never stops the rest of the batch.
+        """
+        # Streaming and polling can flag the same position concurrently.
+        breaches = [
+            breach
+            for breach in breaches
+            if breach[0].id not in self.inflight_liquidations
+        ]
+        if not breaches:
+            return {}
+
+        inflight = {position.id for position, *_ in breaches}
+        self.inflight_liquidations.update(inflight)
+        try:
+            return await self._liquidate_positions(session, breaches, detected_at)
+        finally:
+            self.inflight_liquidations.difference_update(inflight)
+
+    async def _liquidate_positions(
+        self,
+        session: ClientSession,
+        breaches: list[Tuple[PositionRecord, float, float, float]],
+        detected_at: Optional[float] = None,
+    ) -> Dict[object, str]:
+        detected_at = time.monotonic() if detected_at is None else detected_at
+        outcomes: Dict[object, str] = {}
+        latencies: list[float] = []
+        chunk_sem = asyncio.Semaphore(max(1, LIQUIDATION_WRITE_CONCURRENCY))
+        write_sem = asyncio.Semaphore(max(1, LIQUIDATION_WRITE_CONCURRENCY))
+
+        def record(position_id: object, outcome: str) -> None:
+            outcomes[position_id] = outcome
+            latency = time.monotonic() - detected_at
+            latencies.append(latency)
+            self.metrics.liquidation_writes.inc(outcome=outcome)
+            self.metrics.breach_to_write_seconds.observe(latency)
+
+        async def write_one(breach: Tuple[PositionRecord, float, float, float]) -> None:
+            position = breach[0]
+            async with write_sem:
+                try:
+                    updated = await self.mark_liquidated(session, *breach)
+                except Exception as exc:
+                    logger.error("Liquidation write failed for %s: %s", position.id, exc)
+                    record(position.id, WRITE_FAILED)
+                    return
+            record(position.id, WRITE_LIQUIDATED if updated else WRITE_ALREADY_CLOSED)
+
+        async def write_chunk(chunk: Tuple[Tuple[PositionRecord, float, float, float], ...]) -> None:
+            if LIQUIDATION_BULK_RPC:
+                async with chunk_sem:
+                    try:
+                        liquidated = await self.mark_liquidated_bulk(session, chunk)
+                    except Exception as exc:
+                        logger.warning(
+                            "Bulk liquidation of %s position(s) failed; "
+                            "falling back to single writes: %s",
+                            len(chunk),
+                            exc,
+                        )
+                    else:
+                        for position, *_ in chunk:
+                            position_id = position.id
+                            record(
+                                position_id,
+                                WRITE_LIQUIDATED
+                                if position_id in liquidated
+                                else WRITE_ALREADY_CLOSED,
+                            )
+                        return
+            await asyncio.gather(*(write_one(breach) for breach in chunk))
+
+        await asyncio.gather(
+            *(
+                write_chunk(chunk)
+                for chunk in chunked(breaches, max(1, LIQUIDATION_BATCH_SIZE))
+            )
+        )
+
+        self.last_write_latencies = latencies
+        counts = {
+            outcome: sum(1 for value in outcomes.values() if value == outcome)
+            for outcome in (WRITE_LIQUIDATED, WRITE_ALREADY_CLOSED, WRITE_FAILED)
+        }
+        latencies.sort()
+        logger.info(
+            "Liquidation writes: %s liquidated, %s already closed, %s failed | "
+            "breach-to-write p50=%.0fms max=%.0fms",
+            counts[WRITE_LIQUIDATED],
+            counts[WRITE_ALREADY_CLOSED],
+            counts[WRITE_FAILED],
+            latencies[len(latencies) // 2] * 1000,
+            latencies[-1] * 1000,
+        )
+        return outcomes
+
+    async def mark_liquidated_bulk(
+        self,
+        session: ClientSession,
+        breaches: Iterable[Tuple[PositionRecord, float, float, float]],
+    ) -> set:
+        """Liquidate a chunk through one RPC call; returns the ids actually updated."""
+        payload = {
+            "p_liquidations": [
+                {
+                    "id": position.id,
+                    "close_price": current_price,
+                    "current_pnl": pnl_usd,
+                }
+                for position, current_price, pnl_usd, _ in breaches
+            ]
+        }
+        url = f"{SUPABASE_REST_URL}/rpc/liquidate_positions_bulk"
+
+        async with session.post(url, headers=SUPABASE_HEADERS, json=payload) as resp:
+            if resp.status != 200:
+                text = await resp.text()
+                raise RuntimeError(f"Bulk liquidation failed: {resp.status} {text}")
+            rows = await read_json(resp) or []
+
+        liquidated = {row.get("position_id") for row in rows}
+        for position, current_price, pnl_usd, margin_ratio in breaches:
+            if position.id in liquidated:
+                self.log_liquidated(position.id, current_price, pnl_usd, margin_ratio)
+        return liquidated
+
     async def mark_liquidated(
         self,
         session: ClientSession,
-        position: dict,
+        position: PositionRecord,
         current_price: float,
         pnl_usd: float,
         margin_ratio: float,
-    ) -> None:
+    ) -> bool:
+        """Liquidate one position if it is still open. Returns False if it was not."""
         payload = {
             "status": "liquidated",
             "close_price": current_price,
@@ -351,18 +3009,38 @@ class LiquidationWatcher:
             "closed_at": iso_utc_now(),
         }
 
-        position_id = position.get("id")
-        url = f"{SUPABASE_REST_URL}/trading_positions?id=eq.{position_id}"
+        position_id = position.id
+        url = f"{SUPABASE_REST_URL}/trading_positions"
+        params = {
+            "id": f"eq.{position_id}",
+            "status": f"in.({','.join(OPEN_POSITION_STATUSES)})",
+            "select": "id",
+        }
         headers = {**SUPABASE_HEADERS, "Prefer": "return=representation"}
 
-        async with session.patch(url, headers=headers, json=payload) as resp:
+        async with session.patch(url, headers=headers, params=params, json=payload) as resp:
             if resp.status not in (200, 204):
                 text = await resp.text()
                 raise RuntimeError(
                     f"Failed to update position {position_id}: "
                     f"{resp.status} {text}"
                 )
+            rows = await read_json(resp) if resp.status == 200 else []
+
+        if not rows:
+            logger.info("Position %s was already closed; skipping liquidation.", position_id)
+            return False
 
+        self.log_liquidated(position_id, current_price, pnl_usd, margin_ratio)
+        return True
+
+    def log_liquidated(
+        self,
+        position_id: object,
+        current_price: float,
+        pnl_usd: float,
+        margin_ratio: float,
+    ) -> None:
         logger.info(
             "✅ Position %s marked as liquidated at $%.8f (margin_ratio=%.3f, pnl=$%.2f)",
             position_id,
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Replay recorded liquidation watcher ticks as fast as the CPU allows.
+
+Recordings come from running the watcher with RECORD_PATH set. Every recorded
+tick is pushed through `LiquidationWatcher.tick` with Supabase, Birdeye and the
+liquidation writes replaced by in-memory stand-ins, so the position book,
+threshold index and evaluation engines run exactly as they do live.
+
+Usage:
+  python scripts/replay_ticks.py recording.jsonl.gz
+  python scripts/replay_ticks.py recording.jsonl.gz --engine scalar --output scalar.json
+  python scripts/replay_ticks.py recording.jsonl.gz --baseline scalar.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+import liquidation_watcher as lw
+from tick_recorder import replay_snapshots
+
+
+ENGINES = ("indexed", "vectorized", "scalar")
+
+
+class ReplayWatcher(lw.LiquidationWatcher):
+    """LiquidationWatcher whose I/O is served from a recording."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.pending: Tuple[bool, list[dict], list[object]] = (False, [], [])
+        self.prices: Dict[str, float] = {}
+        self.tick_number = 0
+        self.tick_time = 0.0
+        self.liquidated_ids: set = set()
+        self.liquidations: list[dict] = []
+
+    def load_tick(
+        self,
+        record: dict,
+        upserts: list[dict],
+        evicted: list[object],
+        prices: Dict[str, float],
+    ) -> None:
+        self.tick_number += 1
+        self.tick_time = record.get("t") or 0.0
+        self.pending = (bool(record.get("full")), upserts, evicted)
+        self.prices = prices
+
+    async def sync_positions(self, session) -> list[lw.PositionRecord]:
+        full, upserts, evicted = self.pending
+        rows = [row for row in upserts if row.get("id") not in self.liquidated_ids]
+        if full:
+            self.position_book.replace(rows)
+            self.threshold_index.invalidate()
+        else:
+            rows.extend({"id": position_id, "status": "closed"} for position_id in evicted)
+            self.threshold_index.apply(*self.position_book.apply(rows))
+        return self.position_book.values()
+
+    async def resolve_prices(self, session, addresses: Iterable[str]) -> Dict[str, float]:
+        return {address: self.prices[address] for address in addresses if address in self.prices}
+
+    async def liquidate_positions(
+        self,
+        session,
+        breaches: list[Tuple[lw.PositionRecord, float, float, float]],
+        detected_at: Optional[float] = None,
+    ) -> Dict[object, str]:
+        outcomes = {}
+        for position, current_price, pnl_usd, margin_ratio in breaches:
+            position_id = position.id
+            self.liquidated_ids.add(position_id)
+            self.liquidations.append(
+                {
+                    "tick": self.tick_number,
+                    "t": self.tick_time,
+                    "id": position_id,
+                    "token_address": position.token_address,
+                    "price": current_price,
+                    "pnl_usd": pnl_usd,
+                    "margin_ratio": margin_ratio,
+                }
+            )
+            outcomes[position_id] = lw.WRITE_LIQUIDATED
+        return outcomes
+
+
+def configure_engine(engine: str) -> None:
+    lw.THRESHOLD_INDEX = engine == "indexed"
+    lw.VECTORIZED_EVALUATION = engine == "vectorized"
+
+
+async def replay(path: str) -> Tuple[ReplayWatcher, float]:
+    watcher = ReplayWatcher()
+    started_at = time.perf_counter()
+    for record, upserts, evicted, prices in replay_snapshots(path):
+        watcher.load_tick(record, upserts, evicted, prices)
+        await watcher.tick(None)
+    return watcher, time.perf_counter() - started_at
+
+
+def format_ts(value: float) -> str:
+    return datetime.fromtimestamp(value, tz=timezone.utc).isoformat() if value else "-"
+
+
+def compare(liquidations: list[dict], baseline_path: str) -> int:
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = json.load(handle)["liquidations"]
+    current = {(item["tick"], str(item["id"])) for item in liquidations}
+    expected = {(item["tick"], str(item["id"])) for item in baseline}
+    missing = sorted(expected - current)
+    extra = sorted(current - expected)
+    for tick, position_id in missing:
+        print(f"  MISSING  tick={tick} position={position_id}")
+    for tick, position_id in extra:
+        print(f"  EXTRA    tick={tick} position={position_id}")
+    print(f"Baseline diff: {len(missing)} missing, {len(extra)} extra.")
+    return 1 if missing or extra else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recording", help="gzip recording written via RECORD_PATH")
+    parser.add_argument("--engine", choices=ENGINES, default="indexed")
+    parser.add_argument("--output", help="write liquidations and timings as JSON")
+    parser.add_argument("--baseline", help="JSON from a previous --output run to diff against")
+    parser.add_argument("--verbose", action="store_true", help="keep the watcher's INFO logs")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        lw.logger.setLevel(logging.WARNING)
+    configure_engine(args.engine)
+    lw.RECORD_PATH = ""
+
+    watcher, elapsed = asyncio.run(replay(args.recording))
+    evaluate = watcher.metrics.phase_seconds
+    eval_ticks = evaluate.count(phase="evaluate")
+    eval_seconds = evaluate.sums.get(("evaluate",), 0.0)
+
+    for item in watcher.liquidations:
+        print(
+            f"tick={item['tick']} at={format_ts(item['t'])} position={item['id']} "
+            f"token={item['token_address']} price={item['price']:.8f} "
+            f"margin_ratio={item['margin_ratio']:.3f}"
+        )
+    print(
+        f"Replayed {watcher.tick_number} tick(s) in {elapsed:.3f}s "
+        f"({watcher.tick_number / elapsed if elapsed else 0:.0f} ticks/s) with engine={args.engine}: "
+        f"{len(watcher.liquidations)} liquidation(s); evaluate total={eval_seconds * 1000:.1f}ms "
+        f"mean={eval_seconds / eval_ticks * 1000 if eval_ticks else 0:.3f}ms "
+        f"p99<={evaluate.percentile(0.99, phase='evaluate') * 1000:.1f}ms"
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(
+                {
+                    "engine": args.engine,
+                    "ticks": watcher.tick_number,
+                    "elapsed_seconds": elapsed,
+                    "evaluate_seconds": eval_seconds,
+                    "liquidations": watcher.liquidations,
+                },
+                handle,
+                indent=2,
+            )
+
+    if args.baseline:
+        return compare(watcher.liquidations, args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
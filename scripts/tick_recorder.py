@@ -0,0 +1,110 @@
+"""
+Append-only recordings of liquidation watcher ticks.
+
+Each tick is one JSON line inside a gzip stream: the position rows that changed
+since the previous record, the ids that left the book, the token prices that
+changed or disappeared, and the SOL price. The first record after opening a
+file carries the full book (`"full": true`), so a recording that is appended to
+across restarts still replays correctly. A torn final record from a crash is
+ignored when reading.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+
+RECORDING_VERSION = 1
+
+
+class TickRecorder:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.rows: Dict[object, dict] = {}
+        self.prices: Dict[str, float] = {}
+        self.version: Optional[int] = None
+        self.full = True
+        self._write({"type": "header", "version": RECORDING_VERSION})
+
+    def record(
+        self,
+        recorded_at: float,
+        positions: Iterable[dict],
+        price_map: Dict[str, float],
+        sol_price: float,
+        version: Optional[int] = None,
+    ) -> None:
+        """Append one tick. `version` lets an unchanged book skip the diff."""
+        upserts: list[dict] = []
+        evicted: list[object] = []
+        if self.full or version is None or version != self.version:
+            current = {row.get("id"): row for row in positions}
+            upserts = [
+                row for position_id, row in current.items()
+                if self.rows.get(position_id) != row
+            ]
+            evicted = [position_id for position_id in self.rows if position_id not in current]
+            self.rows = current
+            self.version = version
+
+        changed_prices = {
+            address: price
+            for address, price in price_map.items()
+            if self.prices.get(address) != price
+        }
+        unpriced = [address for address in self.prices if address not in price_map]
+        self.prices = dict(price_map)
+
+        self._write(
+            {
+                "type": "tick",
+                "t": recorded_at,
+                "full": self.full,
+                "sol": sol_price,
+                "upsert": upserts,
+                "evict": evicted,
+                "prices": changed_prices,
+                "unpriced": unpriced,
+            }
+        )
+        self.full = False
+
+    def _write(self, record: dict) -> None:
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_recording(path: str) -> Iterator[dict]:
+    """Yield raw records, stopping quietly at a truncated tail."""
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        try:
+            for line in handle:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+        except (EOFError, zlib.error):
+            return
+
+
+def replay_snapshots(
+    path: str,
+) -> Iterator[Tuple[dict, list[dict], list[object], Dict[str, float]]]:
+    """Yield (tick record, upserted rows, evicted ids, full price map) per tick."""
+    prices: Dict[str, float] = {}
+    for record in read_recording(path):
+        if record.get("type") != "tick":
+            continue
+        if record.get("full"):
+            prices = {}
+        prices.update(record.get("prices") or {})
+        for address in record.get("unpriced") or ():
+            prices.pop(address, None)
+        yield record, record.get("upsert") or [], record.get("evict") or [], dict(prices)
@@ -0,0 +1,146 @@
+"""
+Persistent cache for verify_deposits.py.
+
+Finalized Solana transactions never change, so the SystemProgram transfers
+parsed out of one are stored by signature and reused by later runs. Each
+platform wallet also keeps the signatures already listed for it and a cursor
+(the newest of them), so a run only asks getSignaturesForAddress for what came
+after it via `until`. Rows whose block time is older than `max_age_seconds` are
+evicted when the cache is opened.
+
+The connection may be shared between threads (the verifier daemon calls it
+from worker threads); every method holds the cache's lock.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transfers (
+    signature TEXT PRIMARY KEY,
+    block_time INTEGER NOT NULL,
+    transfers TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS signatures (
+    wallet TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    block_time INTEGER NOT NULL,
+    PRIMARY KEY (wallet, signature)
+);
+CREATE INDEX IF NOT EXISTS signatures_wallet_block_time ON signatures (wallet, block_time);
+CREATE TABLE IF NOT EXISTS cursors (
+    wallet TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    block_time INTEGER NOT NULL
+);
+"""
+
+
+class TransactionCache:
+    def __init__(self, path: str, max_age_seconds: float) -> None:
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.signatures_listed = 0
+        self.evicted = self.evict(time.time())
+
+    def horizon(self, now: float) -> float:
+        """Oldest block time kept."""
+        return now - self.max_age_seconds
+
+    def evict(self, now: float) -> int:
+        with self.lock:
+            horizon = self.horizon(now)
+            with self.db:
+                removed = self.db.execute("DELETE FROM transfers WHERE block_time < ?", (horizon,)).rowcount
+                self.db.execute("DELETE FROM signatures WHERE block_time < ?", (horizon,))
+            return removed
+
+    def cursor(self, wallet: str) -> Optional[str]:
+        with self.lock:
+            row = self.db.execute("SELECT signature FROM cursors WHERE wallet = ?", (wallet,)).fetchone()
+            return row[0] if row else None
+
+    def add_signatures(self, wallet: str, entries: Iterable[dict]) -> None:
+        """Store getSignaturesForAddress entries (newest first) and advance the cursor."""
+        with self.lock:
+            rows = [
+                (wallet, entry["signature"], entry["blockTime"])
+                for entry in entries
+                if entry.get("signature") and entry.get("blockTime")
+            ]
+            if not rows:
+                return
+            self.signatures_listed += len(rows)
+            with self.db:
+                self.db.executemany("INSERT OR IGNORE INTO signatures VALUES (?, ?, ?)", rows)
+                newest = max(rows, key=lambda row: row[2])
+                self.db.execute(
+                    "INSERT INTO cursors VALUES (?, ?, ?) ON CONFLICT (wallet) DO UPDATE "
+                    "SET signature = excluded.signature, block_time = excluded.block_time "
+                    "WHERE excluded.block_time >= cursors.block_time",
+                    newest,
+                )
+
+    def oldest(self, wallet: str) -> Optional[tuple[str, int]]:
+        """The wallet's oldest cached (signature, block_time); everything after it is cached."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT signature, block_time FROM signatures WHERE wallet = ? "
+                "ORDER BY block_time ASC LIMIT 1",
+                (wallet,),
+            ).fetchone()
+
+    def signatures_between(self, wallet: str, start: float, end: float) -> list[tuple[str, int]]:
+        """(signature, block_time) pairs for a wallet inside [start, end], newest first."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT signature, block_time FROM signatures "
+                "WHERE wallet = ? AND block_time BETWEEN ? AND ? ORDER BY block_time DESC",
+                (wallet, start, end),
+            ).fetchall()
+
+    def get_transfers(self, signature: str) -> Optional[list[tuple[str, str, int]]]:
+        with self.lock:
+            row = self.db.execute("SELECT transfers FROM transfers WHERE signature = ?", (signature,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [tuple(item) for item in json.loads(row[0])]
+
+    def put_transfers(self, signature: str, block_time: int, transfers: list[tuple[str, str, int]]) -> None:
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO transfers VALUES (?, ?, ?)",
+                (signature, block_time, json.dumps(transfers, separators=(",", ":"))),
+            )
+
+    def commit(self) -> None:
+        with self.lock:
+            self.db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "signatures_listed": self.signatures_listed,
+            "evicted": self.evicted,
+        }
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.commit()
+            self.db.close()
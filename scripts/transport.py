@@ -0,0 +1,169 @@
+"""
+Shared HTTP transport for the scripts.
+
+  create_session       aiohttp ClientSession for liquidation_watcher.py: pooled
+                       keep-alive connections, per-host limits, DNS cache and
+                       connection reuse tracing
+  create_sync_session  requests.Session for verify_deposits.py with a sized
+                       keep-alive pool
+  loads / read_json    orjson when installed, stdlib json otherwise
+
+Compression: aiohttp and requests both ask for gzip/deflate (and br when the
+Brotli package is installed). `compression=False` asks for identity encoding,
+which is cheaper on a fast link to a nearby server.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib json is the fallback
+    orjson = None
+
+
+POOL_SIZE = 100
+POOL_PER_HOST = 32
+KEEPALIVE_SECONDS = 30.0
+DNS_CACHE_SECONDS = 300
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+
+async def read_json(resp: aiohttp.ClientResponse) -> Any:
+    """Decode a response body, treating an empty body as None like resp.json()."""
+    body = await resp.read()
+    return loads(body) if body.strip() else None
+
+
+class TransportStats:
+    """Connection and DNS counters gathered through aiohttp tracing."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.dns_hits = 0
+        self.dns_misses = 0
+        self.by_host: Dict[str, Dict[str, int]] = {}
+
+    def _host(self, host: str) -> Dict[str, int]:
+        return self.by_host.setdefault(host, {"requests": 0, "new": 0, "reused": 0})
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(_session, context, params) -> None:
+            context.host = params.url.host or ""
+            self.requests += 1
+            self._host(context.host)["requests"] += 1
+
+        async def on_connection_create_end(_session, context, _params) -> None:
+            self.new_connections += 1
+            self._host(getattr(context, "host", ""))["new"] += 1
+
+        async def on_connection_reuseconn(_session, context, _params) -> None:
+            self.reused_connections += 1
+            self._host(getattr(context, "host", ""))["reused"] += 1
+
+        async def on_dns_cache_hit(_session, _context, _params) -> None:
+            self.dns_hits += 1
+
+        async def on_dns_cache_miss(_session, _context, _params) -> None:
+            self.dns_misses += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
+
+    def stats(self) -> Dict[str, float]:
+        connections = self.new_connections + self.reused_connections
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "reuse_rate": self.reused_connections / connections if connections else 0.0,
+            "dns_cache_hits": self.dns_hits,
+            "dns_cache_misses": self.dns_misses,
+        }
+
+
+def create_session(
+    timeout: float,
+    stats: Optional[TransportStats] = None,
+    pool_size: int = POOL_SIZE,
+    pool_per_host: int = POOL_PER_HOST,
+    keepalive: float = KEEPALIVE_SECONDS,
+    dns_cache: int = DNS_CACHE_SECONDS,
+    compression: bool = True,
+) -> aiohttp.ClientSession:
+    """Build the tuned session. Must be called with an event loop running."""
+    connector = aiohttp.TCPConnector(
+        limit=pool_size,
+        limit_per_host=pool_per_host,
+        keepalive_timeout=keepalive,
+        use_dns_cache=dns_cache > 0,
+        ttl_dns_cache=dns_cache if dns_cache > 0 else None,
+    )
+    headers = {} if compression else {"Accept-Encoding": "identity"}
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers=headers,
+        json_serialize=dumps,
+        trace_configs=[stats.trace_config()] if stats is not None else None,
+    )
+
+
+def create_sync_session(
+    pool_size: int = POOL_PER_HOST,
+    compression: bool = True,
+):
+    """requests.Session that keeps connections to each host alive between calls."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not compression:
+        session.headers["Accept-Encoding"] = "identity"
+    return session
+
+
+def sync_session_stats(session) -> Dict[str, float]:
+    """Requests served and connections opened across a requests.Session's pools."""
+    requests_served = connections = 0
+    for adapter in {id(adapter): adapter for adapter in session.adapters.values()}.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_served += pool.num_requests
+            connections += pool.num_connections
+    reused = max(0, requests_served - connections)
+    return {
+        "requests": requests_served,
+        "new_connections": connections,
+        "reused_connections": reused,
+        "reuse_rate": reused / requests_served if requests_served else 0.0,
+    }
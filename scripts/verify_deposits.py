@@ -4,12 +4,23 @@ import sys
 import time
 import math
 import json
+import argparse
+import asyncio
+import bisect
+import itertools
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 
-import requests
 from dotenv import load_dotenv
+from postgrest.exceptions import APIError
 from supabase import create_client, Client
 
+import transport
+from metrics import MetricsRegistry, serve_metrics
+from transaction_cache import TransactionCache
+
 
 def env_required(name: str) -> str:
     value = os.getenv(name)
@@ -23,6 +34,10 @@ def lamports(amount_sol: float) -> int:
     return int(round(amount_sol * 1_000_000_000))
 
 
+TRANSFER_TOLERANCE_LAMPORTS = lamports(0.000001)  # tolerance of 0.000001 SOL
+SIGNATURE_PAGE_LIMIT = 1000
+
+
 def parse_iso8601(ts: str) -> datetime:
     # Supabase timestamptz returns ISO strings; ensure tz-aware
     dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
@@ -31,24 +46,103 @@ def parse_iso8601(ts: str) -> datetime:
     return dt.astimezone(timezone.utc)
 
 
+class RateLimited(RuntimeError):
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class SolanaRPC:
-    def __init__(self, rpc_url: str):
+    """
+    JSON-RPC client. get_transactions() packs up to `batch_size` getTransaction
+    calls into one POST and keeps up to `concurrency` such POSTs in flight on a
+    thread pool; a rate-limited request (HTTP 429 or a JSON-RPC rate-limit error)
+    is retried with exponential backoff, honouring Retry-After when present.
+    Set batch_size=1 for providers that reject batch requests.
+    """
+
+    RATE_LIMIT_CODES = (429, -32005)
+
+    def __init__(self, rpc_url: str, batch_size: int = 50, concurrency: int = 4, max_retries: int = 5, backoff: float = 0.5):
         self.rpc_url = rpc_url
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.ids = itertools.count(1)
+        self.rate_limited = 0
+        # One keep-alive pool for the whole run instead of a connection per call
+        self.session = transport.create_sync_session(pool_size=max(self.concurrency, transport.POOL_PER_HOST))
+
+    def _send(self, payload):
+        r = self.session.post(
+            self.rpc_url,
+            data=transport.dumps(payload),
+            headers={"Content-Type": "application/json"},
+            timeout=30,
+        )
+        if r.status_code == 429:
+            retry_after = r.headers.get("Retry-After")
+            raise RateLimited(f"RPC rate limited: {r.text[:200]}", float(retry_after) if retry_after and retry_after.isdigit() else None)
+        r.raise_for_status()
+        return transport.loads(r.content)
+
+    def _send_with_backoff(self, payload):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                data = self._send(payload)
+                replies = data if isinstance(data, list) else [data]
+                limited = [reply for reply in replies if (reply.get("error") or {}).get("code") in self.RATE_LIMIT_CODES]
+                if limited:
+                    raise RateLimited(f"RPC rate limited: {limited[0]['error']}")
+                return data
+            except RateLimited as e:
+                self.rate_limited += 1
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(e.retry_after if e.retry_after is not None else delay)
+                delay *= 2
 
     def _post(self, method: str, params):
         payload = {
             "jsonrpc": "2.0",
-            "id": 1,
+            "id": next(self.ids),
             "method": method,
             "params": params,
         }
-        r = requests.post(self.rpc_url, json=payload, timeout=30)
-        r.raise_for_status()
-        data = r.json()
+        data = self._send_with_backoff(payload)
         if "error" in data:
             raise RuntimeError(f"RPC error {data['error']}")
         return data["result"]
 
+    def _post_batch(self, calls: list[tuple[str, list]]) -> list:
+        """
+        Results of several calls sent as one JSON-RPC batch, in call order. A call
+        whose reply is an error (other than rate limiting) or missing gets None,
+        so one bad signature does not fail the rest of the batch; transport and
+        rate-limit failures still raise.
+        """
+        payload = [
+            {"jsonrpc": "2.0", "id": next(self.ids), "method": method, "params": params}
+            for method, params in calls
+        ]
+        data = self._send_with_backoff(payload[0] if len(payload) == 1 else payload)
+        if len(payload) == 1 and isinstance(data, dict):
+            data = [data]
+        if not isinstance(data, list):
+            raise RuntimeError(f"RPC error {data.get('error') if isinstance(data, dict) else data}")
+        replies = {reply.get("id"): reply for reply in data}
+        results = []
+        for call in payload:
+            reply = replies.get(call["id"])
+            if reply is None or "error" in reply:
+                print(f"  RPC {call['method']} failed for {call['params'][0]}: {(reply or {}).get('error', 'missing reply')}")
+                results.append(None)
+                continue
+            results.append(reply["result"])
+        return results
+
     def get_signatures_for_address(self, address: str, limit: int = 1000, before: str | None = None, until: str | None = None):
         params = [address, {"limit": limit}]
         if before:
@@ -59,7 +153,264 @@ class SolanaRPC:
 
     def get_transaction(self, signature: str):
         # jsonParsed gives readable instruction data
-        return self._post("getTransaction", [signature, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}])
+        return self._post("getTransaction", self._transaction_params(signature))
+
+    def get_transactions(self, signatures: list[str]) -> dict:
+        """
+        Transactions by signature, fetched in concurrent batches. Missing or failed
+        ones map to None; index_transfers leaves those uncached for the next run.
+        """
+        chunks = [signatures[i:i + self.batch_size] for i in range(0, len(signatures), self.batch_size)]
+
+        def fetch(chunk: list[str]) -> list:
+            return self._post_batch([("getTransaction", self._transaction_params(sig)) for sig in chunk])
+
+        if len(chunks) <= 1:
+            results = list(map(fetch, chunks))
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(chunks))) as pool:
+                results = list(pool.map(fetch, chunks))
+        return {sig: tx for chunk, txs in zip(chunks, results) for sig, tx in zip(chunk, txs)}
+
+    @staticmethod
+    def _transaction_params(signature: str) -> list:
+        return [signature, {"encoding": "jsonParsed", "maxSupportedTransactionVersion": 0}]
+
+
+def parse_transfers(tx) -> list[tuple[str, str, int]]:
+    """SystemProgram transfers in a jsonParsed transaction as (source, destination, lamports)."""
+    transaction = (tx or {}).get("transaction") or {}
+    message = transaction.get("message") or {}
+    transfers = []
+    for inst in (message.get("instructions") or []):
+        program = inst.get("program")
+        parsed = inst.get("parsed") or {}
+        if program != "system" or parsed.get("type") != "transfer":
+            continue
+        info = parsed.get("info") or {}
+        source = info.get("source")
+        destination = info.get("destination")
+        lamports_sent = info.get("lamports")
+        if source and destination and isinstance(lamports_sent, int):
+            transfers.append((source, destination, lamports_sent))
+    return transfers
+
+
+class TransferIndex:
+    """
+    SystemProgram transfers into one platform wallet, built from a single scan of
+    its signature history and keyed by (source, destination, lamports bucket).
+
+    Buckets are tolerance + 1 lamports wide, so any amount within the tolerance of
+    an expected one sits in the same or a neighbouring bucket: a lookup checks three
+    keys regardless of how many transfers were indexed. A transfer matches at most
+    one deposit per run.
+    """
+
+    def __init__(self, platform_wallet: str, tolerance_lamports: int):
+        self.platform_wallet = platform_wallet
+        self.tolerance = tolerance_lamports
+        self.bucket = tolerance_lamports + 1
+        self.transfers: dict[tuple[str, str, int], list[tuple[str, int, int]]] = {}
+        self.used: set[str] = set()
+        self.signatures_scanned = 0
+        self.transactions_fetched = 0
+
+    def add(self, signature: str, block_time: int, source: str, destination: str, lamports_sent: int) -> None:
+        key = (source, destination, lamports_sent // self.bucket)
+        self.transfers.setdefault(key, []).append((signature, block_time, lamports_sent))
+
+    def match(self, user_wallet: str, expected_lamports: int, start: datetime, end: datetime) -> str | None:
+        """Signature of the unused transfer closest to the window's centre, if any."""
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+        centre = (start_ts + end_ts) / 2
+        bucket = expected_lamports // self.bucket
+        best = None
+        for key_bucket in (bucket - 1, bucket, bucket + 1):
+            for sig, block_time, lamports_sent in self.transfers.get((user_wallet, self.platform_wallet, key_bucket), ()):
+                if sig in self.used or not start_ts <= block_time <= end_ts:
+                    continue
+                if abs(lamports_sent - expected_lamports) > self.tolerance:
+                    continue
+                if best is None or abs(block_time - centre) < abs(best[1] - centre):
+                    best = (sig, block_time)
+        if best is None:
+            return None
+        self.used.add(best[0])
+        return best[0]
+
+
+def window_slice(entries: list[dict], start_ts: float, end_ts: float) -> list[dict]:
+    """Entries of a newest-first signature page whose blockTime lies in [start_ts, end_ts]."""
+    lo = bisect.bisect_left(entries, -end_ts, key=lambda entry: -entry["blockTime"])
+    hi = bisect.bisect_right(entries, -start_ts, key=lambda entry: -entry["blockTime"])
+    return entries[lo:hi]
+
+
+def scan_signatures(
+    rpc: SolanaRPC,
+    platform_wallet: str,
+    start_ts: float,
+    end_ts: float,
+    before: str | None = None,
+    until: str | None = None,
+    on_page=None,
+) -> tuple[list[dict], int]:
+    """
+    Page backwards from `before` (or the newest signature) and return the entries
+    inside [start_ts, end_ts] plus the number of signatures listed. Each page's
+    in-window slice is found by bisecting its block times, and paging stops at
+    the first page that reaches past start_ts, so the cost follows the window
+    rather than the wallet's history.
+    """
+    found: list[dict] = []
+    listed = 0
+    while True:
+        page = rpc.get_signatures_for_address(platform_wallet, limit=SIGNATURE_PAGE_LIMIT, before=before, until=until) or []
+        listed += len(page)
+        if on_page is not None:
+            on_page(page)
+        timed = [entry for entry in page if entry.get("signature") and entry.get("blockTime")]
+        found.extend(window_slice(timed, start_ts, end_ts))
+        if len(page) < SIGNATURE_PAGE_LIMIT:
+            break
+        if timed and timed[-1]["blockTime"] < start_ts:
+            break
+        before = page[-1].get("signature")
+        if not before:
+            break
+    return found, listed
+
+
+def sync_signatures(rpc: SolanaRPC, cache: TransactionCache, platform_wallet: str, start_ts: float) -> int:
+    """
+    Bring the cached signature list for a wallet up to date and make it reach back
+    to start_ts. Newer signatures are listed until the cursor (pages are followed
+    back to it, or to the cache horizon, so none in between is skipped); a window
+    older than the cached range is backfilled from the oldest cached signature,
+    the nearest known point above it.
+    """
+    cursor = cache.cursor(platform_wallet)
+    horizon = cache.horizon(time.time())
+    entries = []
+    before = None
+    while True:
+        page = rpc.get_signatures_for_address(platform_wallet, limit=SIGNATURE_PAGE_LIMIT, before=before, until=cursor) or []
+        entries.extend(page)
+        if cursor is None or len(page) < SIGNATURE_PAGE_LIMIT:
+            break
+        oldest = page[-1]
+        if not oldest.get("blockTime") or oldest["blockTime"] < horizon:
+            break
+        before = oldest.get("signature")
+    cache.add_signatures(platform_wallet, entries)
+    listed = len(entries)
+
+    oldest = cache.oldest(platform_wallet)
+    if oldest is not None and oldest[1] > start_ts:
+        _, backfilled = scan_signatures(
+            rpc,
+            platform_wallet,
+            start_ts,
+            oldest[1],
+            before=oldest[0],
+            on_page=lambda page: cache.add_signatures(platform_wallet, page),
+        )
+        listed += backfilled
+    return listed
+
+
+def merge_intervals(intervals: list[tuple[datetime, datetime]]) -> list[tuple[datetime, datetime]]:
+    """Sort [start, end] intervals and merge the overlapping ones."""
+    merged: list[tuple[datetime, datetime]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def list_window_signatures(
+    rpc: SolanaRPC,
+    platform_wallet: str,
+    intervals: list[tuple[datetime, datetime]],
+    cache: TransactionCache | None = None,
+) -> tuple[list[tuple[str, int]], int]:
+    """
+    (signature, block_time) pairs of the platform wallet inside any of the
+    sorted, non-overlapping `intervals`, and how many signatures were listed over
+    RPC to find them. Listing walks the whole span once (pages run newest first,
+    so there is no skipping the gaps), but only signatures inside an interval are
+    returned for fetching. With a cache, only signatures newer than the wallet's
+    cursor (or older than anything cached) are listed.
+    """
+    first, last = intervals[0][0].timestamp(), intervals[-1][1].timestamp()
+    if cache is None:
+        signatures, listed = scan_signatures(rpc, platform_wallet, first, last)
+        entries = [(entry["signature"], entry["blockTime"]) for entry in signatures]
+    else:
+        listed = sync_signatures(rpc, cache, platform_wallet, first)
+        entries = cache.signatures_between(platform_wallet, first, last)
+
+    starts = [start.timestamp() for start, _ in intervals]
+    ends = [end.timestamp() for _, end in intervals]
+
+    def inside(block_time: int) -> bool:
+        idx = bisect.bisect_right(starts, block_time) - 1
+        return idx >= 0 and block_time <= ends[idx]
+
+    return [(sig, block_time) for sig, block_time in entries if inside(block_time)], listed
+
+
+def index_transfers(
+    rpc: SolanaRPC,
+    platform_wallet: str,
+    entries: list[tuple[str, int]],
+    tolerance_lamports: int,
+    cache: TransactionCache | None = None,
+) -> TransferIndex:
+    """Index the transfers into the wallet made by these signatures, fetching only uncached transactions."""
+    index = TransferIndex(platform_wallet, tolerance_lamports)
+
+    in_window = []
+    for sig, block_time in entries:
+        if not sig or not block_time:
+            continue
+        in_window.append((sig, block_time, cache.get_transfers(sig) if cache is not None else None))
+
+    missing = [sig for sig, _, transfers in in_window if transfers is None]
+    fetched = rpc.get_transactions(missing) if missing else {}
+    index.transactions_fetched = len(missing)
+
+    for sig, block_time, transfers in in_window:
+        if transfers is None:
+            tx = fetched.get(sig)
+            if not tx:
+                continue  # not available yet; never cached
+            transfers = parse_transfers(tx)
+            if cache is not None:
+                cache.put_transfers(sig, block_time, transfers)
+        for source, destination, lamports_sent in transfers:
+            if destination == platform_wallet:
+                index.add(sig, block_time, source, destination, lamports_sent)
+    if cache is not None:
+        cache.commit()
+    return index
+
+
+def build_transfer_index(
+    rpc: SolanaRPC,
+    platform_wallet: str,
+    intervals: list[tuple[datetime, datetime]],
+    tolerance_lamports: int,
+    cache: TransactionCache | None = None,
+) -> TransferIndex:
+    """List the platform wallet's signatures once and index every transfer into it made inside `intervals`."""
+    entries, listed = list_window_signatures(rpc, platform_wallet, intervals, cache)
+    index = index_transfers(rpc, platform_wallet, entries, tolerance_lamports, cache)
+    index.signatures_scanned = listed
+    return index
 
 
 def find_matching_transfer(rpc: SolanaRPC, platform_wallet: str, user_wallet: str, expected_sol: float, created_at: datetime, window_minutes: int = 60) -> str | None:
@@ -67,123 +418,84 @@ def find_matching_transfer(rpc: SolanaRPC, platform_wallet: str, user_wallet: st
     Search recent txns involving the platform wallet around created_at,
     and return the signature of a SystemProgram transfer from user -> platform
     with the expected amount (within 0.000001 SOL).
+
+    Scans the wallet for this one deposit; main() builds one TransferIndex per
+    platform wallet and matches every pending deposit against it instead.
     """
     start = created_at - timedelta(minutes=window_minutes)
     end = created_at + timedelta(minutes=window_minutes)
+    index = build_transfer_index(rpc, platform_wallet, [(start, end)], TRANSFER_TOLERANCE_LAMPORTS)
+    return index.match(user_wallet, lamports(expected_sol), start, end)
 
-    # Strategy: get signatures for the platform wallet, then fetch tx details and match
-    # Note: We could paginate if needed; start with last N signatures
-    signatures = rpc.get_signatures_for_address(platform_wallet, limit=1000)
-    if not signatures:
-        return None
-
-    expected_lamports = lamports(expected_sol)
-    tolerance_lamports = lamports(0.000001)  # tolerance of 0.000001 SOL
-
-    for sig_entry in signatures:
-        sig = sig_entry.get("signature")
-        block_time = sig_entry.get("blockTime")
-        if not sig or not block_time:
-            continue
-        block_dt = datetime.fromtimestamp(block_time, tz=timezone.utc)
-        if block_dt < start or block_dt > end:
-            continue
 
-        tx = rpc.get_transaction(sig)
-        if not tx:
-            continue
-        meta = (tx or {}).get("meta") or {}
-        transaction = (tx or {}).get("transaction") or {}
-        message = transaction.get("message") or {}
-        acct_keys = [k.get("pubkey") if isinstance(k, dict) else k for k in (message.get("accountKeys") or [])]
-        if not acct_keys or user_wallet not in acct_keys or platform_wallet not in acct_keys:
+def apply_matches(supabase: Client, matches: list[tuple[dict, str]]) -> tuple[int, int]:
+    """
+    Mark matched deposits verified and credit the balances in one
+    verify_deposits_bulk call: credits are summed per wallet and added on the
+    server in the same transaction. Returns (deposits verified, wallets credited).
+
+    Only a database without the function falls back to per-row updates. Any
+    other failure (a timeout, a dropped connection) may have happened after the
+    call committed, so it is raised and the deposits stay pending until the next
+    run, where the function skips whatever it already verified.
+    """
+    if not matches:
+        return 0, 0
+    try:
+        res = supabase.rpc(
+            "verify_deposits_bulk",
+            {"p_matches": [{"id": row["id"], "txid": sig} for row, sig in matches]},
+        ).execute()
+    except APIError as e:
+        if str(e.code) not in ("PGRST202", "404"):
+            raise
+        print(f"verify_deposits_bulk is not available ({e.message}); updating deposits one by one.")
+        return apply_matches_individually(supabase, matches)
+
+    results = res.data or []
+    credited: dict[str, float] = {}
+    balances: dict[str, float | None] = {}
+    for result in results:
+        wallet_address = result["deposit_wallet"]
+        credited[wallet_address] = credited.get(wallet_address, 0.0) + float(result["credited_amount"])
+        balances[wallet_address] = float(result["new_balance"]) if result.get("new_balance") is not None else None
+    for wallet_address, amount in credited.items():
+        new_sol = balances[wallet_address]
+        if new_sol is None:
+            print(f"  No user profile for {wallet_address}; {amount:.9f} SOL verified but not credited")
             continue
+        print(f"  Credited {wallet_address}: {new_sol - amount:.9f} -> {new_sol:.9f} SOL")
+    skipped = len(matches) - len(results)
+    if skipped:
+        print(f"  {skipped} match(es) skipped: deposit already verified or txid already used")
+    return len(results), sum(1 for new_sol in balances.values() if new_sol is not None)
 
-        # Inspect parsed instructions for a SystemProgram transfer
-        for inst in (message.get("instructions") or []):
-            program = inst.get("program")
-            parsed = inst.get("parsed") or {}
-            if program != "system" or parsed.get("type") != "transfer":
-                continue
-            info = parsed.get("info") or {}
-            source = info.get("source")
-            destination = info.get("destination")
-            lamports_sent = info.get("lamports")
-            if source == user_wallet and destination == platform_wallet and isinstance(lamports_sent, int):
-                if abs(lamports_sent - expected_lamports) <= tolerance_lamports:
-                    return sig
-    return None
-
-
-def main():
-    load_dotenv()
-
-    supabase_url = env_required("SUPABASE_URL")
-    supabase_service_key = env_required("SUPABASE_SERVICE_ROLE_KEY")
-    solana_rpc_url = env_required("SOLANA_RPC_URL")
-    platform_wallet_default = env_required("PLATFORM_WALLET")
-
-    window_minutes = int(os.getenv("VERIFY_WINDOW_MINUTES", "60"))
-    batch_limit = int(os.getenv("VERIFY_BATCH_LIMIT", "100"))
-
-    rpc = SolanaRPC(solana_rpc_url)
-    supabase: Client = create_client(supabase_url, supabase_service_key)
-
-    # Fetch deposits that need verification: either is_verified = false OR txid is null
-    # Limit batch size for each run
-    res = supabase.table("deposit_transactions") \
-        .select("id,wallet_address,amount,created_at,txid,is_verified,platform_wallet") \
-        .order("created_at", desc=True) \
-        .limit(batch_limit) \
-        .execute()
-
-    rows = res.data or []
-    if not rows:
-        print("No deposits to inspect.")
-        return
 
+def apply_matches_individually(supabase: Client, matches: list[tuple[dict, str]]) -> tuple[int, int]:
+    """
+    Fallback for databases without verify_deposits_bulk. A deposit is only
+    marked while it is not verified yet, and only a row this update actually
+    changed is credited, so a deposit another run already verified is never
+    credited twice.
+    """
     verified = 0
     updated_balances = 0
-    for row in rows:
-        txid = row.get("txid")
-        is_verified = row.get("is_verified", False)
-        if is_verified and txid:
-            continue  # already verified
-
+    for row, sig in matches:
         wallet_address = row["wallet_address"]
         amount = float(row["amount"])
-        created_at = parse_iso8601(row["created_at"])
-
-        print(f"Checking deposit id={row['id']} wallet={wallet_address} amount={amount} created_at={created_at.isoformat()} ...")
-
-        row_wallet = row.get("platform_wallet") or platform_wallet_default
-        try:
-            sig = find_matching_transfer(
-                rpc=rpc,
-                platform_wallet=row_wallet,
-                user_wallet=wallet_address,
-                expected_sol=amount,
-                created_at=created_at,
-                window_minutes=window_minutes,
-            )
-        except Exception as e:
-            print(f"  RPC error while searching transactions: {e}")
-            continue
-
-        if not sig:
-            print("  No matching on-chain transfer found (yet).")
-            continue
-
-        print(f"  Matched on-chain tx: {sig}")
 
         # Update the deposit row with txid and is_verified = true
-        supabase.table("deposit_transactions") \
+        res = supabase.table("deposit_transactions") \
             .update({"txid": sig, "is_verified": True}) \
             .eq("id", row["id"]) \
+            .or_("is_verified.is.false,is_verified.is.null") \
             .execute()
+        if not res.data:
+            print(f"  Deposit {row['id']} was already verified; not crediting it again")
+            continue
         verified += 1
 
-        # Credit user's platform balance atomically by adding amount
+        # Credit user's platform balance by adding amount
         # We do a read then write. For stronger safety, this should be a Postgres function or use row-level lock.
         profile_res = supabase.table("user_profiles") \
             .select("wallet_address,sol_balance") \
@@ -199,11 +511,325 @@ def main():
             .execute()
         updated_balances += 1
         print(f"  Credited platform balance: {current_sol:.9f} -> {new_sol:.9f} SOL")
+    return verified, updated_balances
+
+
+@dataclass
+class Settings:
+    supabase_url: str
+    supabase_service_key: str
+    solana_rpc_url: str
+    platform_wallet: str
+    window_minutes: int
+    batch_limit: int
+    max_pending_age_days: float
+    cache_path: str
+    cache_max_age_days: float
+    rpc_batch_size: int
+    rpc_concurrency: int
+    interval_seconds: float
+    queue_size: int
+    metrics_host: str
+    metrics_port: int
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_dotenv()
+        return cls(
+            supabase_url=env_required("SUPABASE_URL"),
+            supabase_service_key=env_required("SUPABASE_SERVICE_ROLE_KEY"),
+            solana_rpc_url=env_required("SOLANA_RPC_URL"),
+            platform_wallet=env_required("PLATFORM_WALLET"),
+            window_minutes=int(os.getenv("VERIFY_WINDOW_MINUTES", "60")),
+            batch_limit=int(os.getenv("VERIFY_BATCH_LIMIT", "100")),
+            # Older unverified deposits are treated as abandoned and no longer scanned
+            max_pending_age_days=float(os.getenv("VERIFY_MAX_PENDING_AGE_DAYS", "7")),
+            # Parsed transactions and signature cursors persist here between runs ("" disables)
+            cache_path=os.getenv("VERIFY_CACHE_PATH", "verify_deposits_cache.sqlite3"),
+            cache_max_age_days=float(os.getenv("VERIFY_CACHE_MAX_AGE_DAYS", "30")),
+            rpc_batch_size=int(os.getenv("SOLANA_RPC_BATCH_SIZE", "50")),
+            rpc_concurrency=int(os.getenv("SOLANA_RPC_CONCURRENCY", "4")),
+            # Daemon mode only
+            interval_seconds=float(os.getenv("VERIFY_INTERVAL_SECONDS", "30")),
+            queue_size=int(os.getenv("VERIFY_QUEUE_SIZE", "8")),
+            metrics_host=os.getenv("VERIFY_METRICS_HOST", "127.0.0.1"),
+            metrics_port=int(os.getenv("VERIFY_METRICS_PORT", "9109")),
+        )
+
+    @property
+    def window(self) -> timedelta:
+        return timedelta(minutes=self.window_minutes)
+
+
+def connect(settings: Settings) -> tuple[SolanaRPC, Client, TransactionCache | None]:
+    rpc = SolanaRPC(settings.solana_rpc_url, batch_size=settings.rpc_batch_size, concurrency=settings.rpc_concurrency)
+    supabase: Client = create_client(settings.supabase_url, settings.supabase_service_key)
+    cache = TransactionCache(settings.cache_path, settings.cache_max_age_days * 86400) if settings.cache_path else None
+    return rpc, supabase, cache
+
+
+def fetch_pending(supabase: Client, batch_limit: int, max_age_days: float) -> list[dict]:
+    # Fetch deposits that need verification: either is_verified = false OR txid is null
+    # Rows settled by another source (Atlos postbacks) never have an on-chain
+    # transfer to match, and rows older than max_age_days are abandoned; both
+    # would otherwise stay pending forever and stretch every scan back to them.
+    # Limit batch size for each run
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    res = supabase.table("deposit_transactions") \
+        .select("id,wallet_address,amount,created_at,txid,is_verified,platform_wallet") \
+        .or_("is_verified.is.false,is_verified.is.null,txid.is.null") \
+        .is_("verification_source", "null") \
+        .gte("created_at", cutoff.isoformat()) \
+        .order("created_at", desc=True) \
+        .limit(batch_limit) \
+        .execute()
+    return res.data or []
 
-    print(f"Done. verified={verified}, balances_updated={updated_balances}")
 
+def group_pending(rows: list[dict], platform_wallet_default: str) -> dict[str, list[tuple[dict, datetime]]]:
+    """Pending deposits by the platform wallet they were sent to, with parsed created_at."""
+    groups: dict[str, list[tuple[dict, datetime]]] = {}
+    for row in rows:
+        row_wallet = row.get("platform_wallet") or platform_wallet_default
+        groups.setdefault(row_wallet, []).append((row, parse_iso8601(row["created_at"])))
+    return groups
 
-if __name__ == "__main__":
-    main()
 
+def deposit_intervals(deposits: list[tuple[dict, datetime]], window: timedelta) -> list[tuple[datetime, datetime]]:
+    """Every pending deposit's [created_at - window, created_at + window], merged where they overlap."""
+    return merge_intervals([(created_at - window, created_at + window) for _, created_at in deposits])
+
+
+def match_deposits(index: TransferIndex, deposits: list[tuple[dict, datetime]], window: timedelta) -> list[tuple[dict, str]]:
+    # Transfers already recorded against a deposit cannot credit another one
+    # (verify_deposits_bulk also refuses a txid that is already stored).
+    index.used.update(row["txid"] for row, _ in deposits if row.get("txid"))
+
+    matches = []
+    for row, created_at in deposits:
+        wallet_address = row["wallet_address"]
+        amount = float(row["amount"])
+
+        print(f"Checking deposit id={row['id']} wallet={wallet_address} amount={amount} created_at={created_at.isoformat()} ...")
+
+        sig = index.match(wallet_address, lamports(amount), created_at - window, created_at + window)
+        if not sig:
+            print("  No matching on-chain transfer found (yet).")
+            continue
+
+        print(f"  Matched on-chain tx: {sig}")
+        matches.append((row, sig))
+    return matches
+
+
+def print_connection_stats(rpc: SolanaRPC, cache: TransactionCache | None) -> None:
+    conn = transport.sync_session_stats(rpc.session)
+    print(
+        f"RPC connections: requests={conn['requests']} opened={conn['new_connections']} "
+        f"reuse_rate={conn['reuse_rate']:.2f} rate_limited={rpc.rate_limited}"
+    )
+    if cache is not None:
+        stats = cache.stats()
+        print(
+            f"Transaction cache: hits={stats['hits']} misses={stats['misses']} "
+            f"hit_rate={stats['hit_rate']:.2f} new_signatures={stats['signatures_listed']} "
+            f"evicted={stats['evicted']}"
+        )
+
+
+class VerifierDaemon:
+    """
+    Long-running verifier: warm clients, a poll every `interval_seconds`, and a
+    staged pipeline joined by bounded queues so one platform wallet's transactions
+    can be fetched while the next wallet's signatures are being listed:
 
+      poll -> scan (list signatures) -> fetch (transactions) -> match -> write
+
+    Blocking RPC and Supabase calls run in worker threads. A deposit stays out of
+    later polls until its batch has been written. On shutdown the poller stops and
+    a sentinel drains every stage before the process exits.
+    """
+
+    STAGES = ("scan", "fetch", "match", "write")
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.rpc, self.supabase, self.cache = connect(settings)
+        self.stop_event = asyncio.Event()
+        self.queues = {stage: asyncio.Queue(maxsize=settings.queue_size) for stage in self.STAGES}
+        self.inflight: set = set()
+
+        registry = MetricsRegistry()
+        self.registry = registry
+        self.stage_items = registry.counter(
+            "verifier_stage_items_total", "Items each pipeline stage finished.", ("stage",)
+        )
+        self.stage_errors = registry.counter(
+            "verifier_stage_errors_total", "Items a pipeline stage dropped after an error.", ("stage",)
+        )
+        self.stage_seconds = registry.histogram(
+            "verifier_stage_seconds", "Time a pipeline stage spent per item.", ("stage",)
+        )
+        self.queue_depth = registry.gauge(
+            "verifier_queue_depth", "Items waiting in front of each pipeline stage.", ("stage",)
+        )
+        self.deposits = registry.counter(
+            "verifier_deposits_total", "Pending deposits by outcome.", ("outcome",)
+        )
+
+    def request_shutdown(self) -> None:
+        print("Shutdown signal received; draining in-flight work...")
+        self.stop_event.set()
+
+    async def run(self) -> None:
+        metrics_runner = None
+        if self.settings.metrics_port:
+            try:
+                metrics_runner = await serve_metrics(self.registry, self.settings.metrics_host, self.settings.metrics_port)
+            except OSError as e:
+                print(f"Metrics endpoint unavailable on {self.settings.metrics_host}:{self.settings.metrics_port}: {e}")
+        handlers = {"scan": self.scan, "fetch": self.fetch, "match": self.match, "write": self.write}
+        stages = [
+            self.stage(stage, handlers[stage], self.STAGES[i + 1] if i + 1 < len(self.STAGES) else None)
+            for i, stage in enumerate(self.STAGES)
+        ]
+        try:
+            await asyncio.gather(self.poll(), *stages)
+        finally:
+            if self.cache is not None:
+                self.cache.close()
+            if metrics_runner is not None:
+                await metrics_runner.cleanup()
+        print("Verifier stopped.")
+
+    async def put(self, stage: str, item) -> None:
+        await self.queues[stage].put(item)
+        self.queue_depth.set(self.queues[stage].qsize(), stage=stage)
+
+    async def poll(self) -> None:
+        while not self.stop_event.is_set():
+            started_at = time.monotonic()
+            try:
+                if self.cache is not None:
+                    self.cache.evicted += await asyncio.to_thread(self.cache.evict, time.time())
+                rows = await asyncio.to_thread(
+                    fetch_pending, self.supabase, self.settings.batch_limit, self.settings.max_pending_age_days
+                )
+            except Exception as e:
+                print(f"Failed to fetch pending deposits: {e}")
+                self.stage_errors.inc(stage="poll")
+                rows = []
+            fresh = [row for row in rows if row["id"] not in self.inflight]
+            for row_wallet, deposits in group_pending(fresh, self.settings.platform_wallet).items():
+                self.inflight.update(row["id"] for row, _ in deposits)
+                await self.put("scan", (row_wallet, deposits))
+            self.stage_seconds.observe(time.monotonic() - started_at, stage="poll")
+            self.stage_items.inc(stage="poll")
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=self.settings.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+        await self.put("scan", None)
+
+    async def stage(self, name: str, handle, next_stage: str | None) -> None:
+        queue = self.queues[name]
+        while True:
+            item = await queue.get()
+            self.queue_depth.set(queue.qsize(), stage=name)
+            if item is None:
+                if next_stage is not None:
+                    await self.put(next_stage, None)
+                return
+            try:
+                with self.stage_seconds.time(stage=name):
+                    result = await handle(*item)
+            except Exception as e:
+                row_wallet, deposits = item[0], item[1]
+                print(f"{name} failed for {row_wallet}: {e}")
+                self.stage_errors.inc(stage=name)
+                self.inflight.difference_update(row["id"] for row, _ in deposits)
+                continue
+            self.stage_items.inc(stage=name)
+            if next_stage is not None:
+                await self.put(next_stage, result)
+
+    async def scan(self, row_wallet: str, deposits: list[tuple[dict, datetime]]):
+        intervals = deposit_intervals(deposits, self.settings.window)
+        entries, _ = await asyncio.to_thread(list_window_signatures, self.rpc, row_wallet, intervals, self.cache)
+        return row_wallet, deposits, entries
+
+    async def fetch(self, row_wallet: str, deposits: list[tuple[dict, datetime]], entries: list[tuple[str, int]]):
+        index = await asyncio.to_thread(
+            index_transfers, self.rpc, row_wallet, entries, TRANSFER_TOLERANCE_LAMPORTS, self.cache
+        )
+        return row_wallet, deposits, index
+
+    async def match(self, row_wallet: str, deposits: list[tuple[dict, datetime]], index: TransferIndex):
+        return row_wallet, deposits, match_deposits(index, deposits, self.settings.window)
+
+    async def write(self, row_wallet: str, deposits: list[tuple[dict, datetime]], matches: list[tuple[dict, str]]):
+        try:
+            verified, _ = await asyncio.to_thread(apply_matches, self.supabase, matches)
+        finally:
+            self.inflight.difference_update(row["id"] for row, _ in deposits)
+        self.deposits.inc(verified, outcome="verified")
+        self.deposits.inc(len(deposits) - len(matches), outcome="unmatched")
+
+
+async def run_daemon() -> None:
+    daemon = VerifierDaemon(Settings.from_env())
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, daemon.request_shutdown)
+
+    await daemon.run()
+
+
+def main():
+    settings = Settings.from_env()
+    rpc, supabase, cache = connect(settings)
+
+    rows = fetch_pending(supabase, settings.batch_limit, settings.max_pending_age_days)
+    if not rows:
+        print("No deposits to inspect.")
+        if cache is not None:
+            cache.close()
+        return
+
+    matches = []
+    for row_wallet, deposits in group_pending(rows, settings.platform_wallet).items():
+        intervals = deposit_intervals(deposits, settings.window)
+        try:
+            index = build_transfer_index(rpc, row_wallet, intervals, TRANSFER_TOLERANCE_LAMPORTS, cache)
+        except Exception as e:
+            print(f"RPC error while scanning {row_wallet}: {e}")
+            continue
+        print(
+            f"Indexed {row_wallet}: signatures={index.signatures_scanned} "
+            f"transactions={index.transactions_fetched} transfers={sum(len(v) for v in index.transfers.values())}"
+        )
+        matches.extend(match_deposits(index, deposits, settings.window))
+
+    verified, updated_balances = apply_matches(supabase, matches)
+
+    print(f"Done. verified={verified}, balances_updated={updated_balances}")
+    print_connection_stats(rpc, cache)
+    if cache is not None:
+        cache.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify on-chain SOL deposits and credit platform balances.")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and poll every VERIFY_INTERVAL_SECONDS instead of exiting after one pass",
+    )
+    if parser.parse_args().daemon:
+        try:
+            asyncio.run(run_daemon())
+        except KeyboardInterrupt:
+            print("Verifier interrupted by user.")
+    else:
+        main()
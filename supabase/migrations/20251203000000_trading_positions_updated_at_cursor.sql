@@ -0,0 +1,21 @@
+/*
+  Keep trading_positions.updated_at honest so the liquidation watcher can
+  sync its in-memory position book incrementally by (updated_at, id).
+*/
+
+CREATE OR REPLACE FUNCTION update_updated_at_column()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = now();
+  RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS update_trading_positions_updated_at ON trading_positions;
+CREATE TRIGGER update_trading_positions_updated_at
+  BEFORE UPDATE ON trading_positions
+  FOR EACH ROW
+  EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS idx_trading_positions_updated_at_id
+  ON trading_positions(updated_at, id);
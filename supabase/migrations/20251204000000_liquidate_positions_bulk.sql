@@ -0,0 +1,38 @@
+/*
+  Bulk liquidation entry point for the liquidation watcher.
+
+  Summary:
+    - liquidate_positions_bulk takes a JSON array of
+      {"id", "close_price", "current_pnl"} objects and liquidates them in one
+      statement
+    - Only rows still in 'open' or 'opening' are touched, so a position that
+      was closed in the meantime is never overwritten
+    - Returns the ids that were actually liquidated
+*/
+
+CREATE OR REPLACE FUNCTION public.liquidate_positions_bulk(p_liquidations JSONB)
+RETURNS TABLE (position_id INTEGER)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  RETURN QUERY
+  UPDATE trading_positions AS tp
+  SET
+    status = 'liquidated',
+    close_price = (item->>'close_price')::DECIMAL(20, 10),
+    close_reason = 'liquidation',
+    current_pnl = (item->>'current_pnl')::DECIMAL(20, 2),
+    margin_call_triggered = TRUE,
+    updated_at = NOW(),
+    closed_at = NOW()
+  FROM jsonb_array_elements(p_liquidations) AS item
+  WHERE tp.id = (item->>'id')::INTEGER
+    AND tp.status IN ('open', 'opening')
+  RETURNING tp.id;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.liquidate_positions_bulk(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.liquidate_positions_bulk(JSONB) TO service_role;
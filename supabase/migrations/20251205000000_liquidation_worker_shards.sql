@@ -0,0 +1,55 @@
+/*
+  Sharding support for the liquidation watcher.
+
+  Summary:
+    - trading_positions.token_shard buckets token_address into 1024 stable
+      shards so a worker can fetch only the positions it owns
+    - liquidation_workers holds one heartbeat row per running watcher
+    - liquidation_worker_heartbeat renews the caller's lease using the database
+      clock and returns every worker whose lease is still live, so all workers
+      build the same hash ring
+*/
+
+ALTER TABLE IF EXISTS trading_positions
+  ADD COLUMN IF NOT EXISTS token_shard SMALLINT
+  GENERATED ALWAYS AS ((hashtext(token_address) & 1023)::SMALLINT) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_trading_positions_token_shard_status
+  ON trading_positions(token_shard, status);
+
+CREATE TABLE IF NOT EXISTS liquidation_workers (
+  worker_id TEXT PRIMARY KEY,
+  started_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+  heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+ALTER TABLE liquidation_workers ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.liquidation_worker_heartbeat(
+  p_worker_id TEXT,
+  p_lease_seconds INTEGER
+)
+RETURNS TABLE (worker_id TEXT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  INSERT INTO liquidation_workers AS lw (worker_id, heartbeat_at)
+  VALUES (p_worker_id, NOW())
+  ON CONFLICT ON CONSTRAINT liquidation_workers_pkey
+  DO UPDATE SET heartbeat_at = NOW();
+
+  DELETE FROM liquidation_workers AS lw
+  WHERE lw.heartbeat_at < NOW() - make_interval(secs => p_lease_seconds * 10);
+
+  RETURN QUERY
+  SELECT lw.worker_id
+  FROM liquidation_workers AS lw
+  WHERE lw.heartbeat_at >= NOW() - make_interval(secs => p_lease_seconds)
+  ORDER BY lw.worker_id;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.liquidation_worker_heartbeat(TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.liquidation_worker_heartbeat(TEXT, INTEGER) TO service_role;
@@ -0,0 +1,26 @@
+/*
+  Push trading_positions changes to the liquidation watcher.
+
+  Summary:
+    - adds trading_positions to the supabase_realtime publication so Realtime
+      relays committed inserts, updates and deletes (postgres_changes) to
+      subscribers; the watcher's POSITION_FEED mode listens as service_role
+    - skipped when the publication is missing (self-hosted Postgres without
+      Realtime) or already includes the table
+*/
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'supabase_realtime')
+     AND NOT EXISTS (
+       SELECT 1
+       FROM pg_publication_tables
+       WHERE pubname = 'supabase_realtime'
+         AND schemaname = 'public'
+         AND tablename = 'trading_positions'
+     )
+  THEN
+    ALTER PUBLICATION supabase_realtime ADD TABLE public.trading_positions;
+  END IF;
+END;
+$$;
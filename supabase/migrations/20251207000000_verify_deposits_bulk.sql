@@ -0,0 +1,71 @@
+/*
+  Bulk deposit verification for scripts/verify_deposits.py.
+
+  Summary:
+    - verify_deposits_bulk takes a JSON array of {"id", "txid"} objects and
+      marks those deposits verified in one statement
+    - Deposits that are already verified, and txids already recorded on
+      another deposit, are skipped, so a transfer is never credited twice
+    - The amounts actually verified are summed per wallet and added to
+      user_profiles.sol_balance in the same transaction, replacing the
+      client-side read-then-write of the balance
+    - Returns one row per verified deposit with its wallet's new balance
+*/
+
+CREATE OR REPLACE FUNCTION public.verify_deposits_bulk(p_matches JSONB)
+RETURNS TABLE (
+  deposit_id UUID,
+  deposit_wallet TEXT,
+  credited_amount DECIMAL(20, 8),
+  new_balance DECIMAL(20, 8)
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+  RETURN QUERY
+  WITH matches AS (
+    SELECT DISTINCT ON (item->>'txid')
+      (item->>'id')::UUID AS id,
+      item->>'txid' AS txid
+    FROM jsonb_array_elements(p_matches) AS item
+  ),
+  verified AS (
+    UPDATE deposit_transactions AS d
+    SET
+      txid = m.txid,
+      is_verified = TRUE,
+      updated_at = NOW()
+    FROM matches AS m
+    WHERE d.id = m.id
+      AND (d.is_verified IS NOT TRUE OR d.txid IS NULL)
+      AND NOT EXISTS (
+        SELECT 1
+        FROM deposit_transactions AS other
+        WHERE other.txid = m.txid
+          AND other.id <> d.id
+      )
+    RETURNING d.id, d.wallet_address, d.amount
+  ),
+  credited AS (
+    UPDATE user_profiles AS p
+    SET
+      sol_balance = COALESCE(p.sol_balance, 0) + totals.total,
+      updated_at = NOW()
+    FROM (
+      SELECT v.wallet_address, SUM(v.amount) AS total
+      FROM verified AS v
+      GROUP BY v.wallet_address
+    ) AS totals
+    WHERE p.wallet_address = totals.wallet_address
+    RETURNING p.wallet_address, p.sol_balance
+  )
+  SELECT v.id, v.wallet_address, v.amount, c.sol_balance
+  FROM verified AS v
+  LEFT JOIN credited AS c ON c.wallet_address = v.wallet_address;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.verify_deposits_bulk(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.verify_deposits_bulk(JSONB) TO service_role;